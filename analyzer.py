@@ -1,67 +1,199 @@
 import os
+import sys
+import time
 import argparse
 import re
 
-from tokenizer import Tokenizer
-from compilation_engine import CompilationEngine
+from compiler import compile_many
+from tokenizer import LEXERS
+from cost_model import CostModel, SORT_KEYS
+from code_generator import generate_program, vm_text
+from string_pool import StringPool
+from executor import Executor, JackError
+from pipeline import Pipeline, read_os_dir
+from sources import is_archive, scan_dir, read_archive, open_sink
+from watch import Watcher, DEBOUNCE
+from emulator import HackCPU, signed
+
+# Main's statics once BuildTest/Main.jack has run: fib(12), 1 + ... + 100 and flags(7, -3)
+BUILD_TEST_STATICS = {'Main.0': 144, 'Main.1': 5050, 'Main.2': -3}
+
 
 class Analyzer:
-    def __init__(self, target_path):
-        if os.path.isdir(target_path):
-            self.jack_files = [
-                os.path.join(target_path, f) for f in os.listdir(target_path) if f.endswith('.jack')
-            ]
+    def __init__(self, target_path, workers=None, recursive=False, output_path=None, lexer='python'):
+        # workers > 1 compiles each large class a few subroutines per worker process
+        self.workers = workers
+        self.lexer = lexer
+        self.target_path = target_path
+        self.recursive = recursive
+        # outputs go next to each jack file (in target/) unless an output tree or archive is given
+        self.output_path = output_path
+        self.archive = None
+        if is_archive(target_path) and os.path.isfile(target_path):
+            # .jack members are streamed out of the archive, never unpacked to disk
+            self.archive = target_path
+            self.jack_files = None
+            self.root = None
+            if output_path is None:
+                # outputs go to a matching archive in target/ next to it
+                self.output_path = os.path.join(os.path.dirname(target_path), 'target', os.path.basename(target_path))
+        elif os.path.isdir(target_path):
+            self.jack_files = scan_dir(target_path, recursive)
+            self.root = target_path
             if len(self.jack_files) == 0:
                 raise ValueError('No jack files found in the target directory')
         elif os.path.isfile(target_path) and target_path.endswith('.jack'):
             self.jack_files = [target_path]
+            self.root = os.path.dirname(target_path)
         else:
-            raise ValueError('Target file is a not a jack file')
+            raise ValueError('Target file is a not a jack file, directory or tar/zip archive')
 
 
-    def analyze(self):
-        parser_output_files = []
+    def _read_sources(self, verbose=True):
+        if self.archive is not None:
+            for name, source in read_archive(self.archive):
+                if verbose:
+                    print(f'Analyzing {self.archive}:{name}...')
+                yield name, source
+            return
 
         for jack_file in self.jack_files:
-            print(f'Analyzing {jack_file}...')
+            if verbose:
+                print(f'Analyzing {jack_file}...')
+            with open(jack_file) as f:
+                yield jack_file, f.read()
+
 
-            target_dir = os.path.join(os.path.dirname(jack_file), 'target')
-            if not os.path.isdir(target_dir):
-                os.mkdir(target_dir)
-            basename = os.path.basename(jack_file).split('.')[0]
+    def _require_files(self, mode: str):
+        if self.jack_files is None:
+            raise ValueError(f'{mode} needs Jack files or a directory, not an archive')
 
-            tokenizer_output_file = os.path.join(target_dir, basename+'T.xml')
-            parser_output_file = os.path.join(target_dir, basename+'.xml')
 
-            tokenizer = Tokenizer(jack_file)
-            compilation_engine = CompilationEngine(tokenizer)
+    def compile(self, verbose=True):
+        # in-memory compile results, one per jack file, without writing any output
+        return compile_many(self._read_sources(verbose), self.workers, self.lexer)
 
-            # Writing the *T.xml file
-            while tokenizer.has_more_tokens():
-                token, token_type = tokenizer.advance()
-                if token_type == 'stringConstant':
-                    token = tokenizer.string_val()
 
-                tokenizer.write_token_tag(token_type, token)
+    def analyze(self):
+        if self.output_path is not None:
+            return self._analyze_to_sink()
 
-            tokenizer.write_xml_file(tokenizer_output_file)
-            # Reinitialize current_token_index
-            tokenizer.current_token_index = -1
+        self._require_files('Writing output next to the inputs')
+        return [self.write_result(result) for result in self.compile()]
 
-            # Writing the analyzed *.xml file
-            while tokenizer.has_more_tokens():
-                token, token_type = tokenizer.advance()
 
-                if token == 'class':
-                    compilation_engine.compile_class(token, token_type)
+    def write_result(self, result) -> str:
+        # *T.xml and *.xml of one compiled jack file in the target dir next to it
+        jack_file = result.name
+        target_dir = os.path.join(os.path.dirname(jack_file), 'target')
+        if not os.path.isdir(target_dir):
+            os.mkdir(target_dir)
+        basename = os.path.basename(jack_file).split('.')[0]
 
-            compilation_engine.wrtie_xml_file(parser_output_file)
+        tokenizer_output_file = os.path.join(target_dir, basename+'T.xml')
+        parser_output_file = os.path.join(target_dir, basename+'.xml')
+
+        # Writing the *T.xml and analyzed *.xml files
+        with open(tokenizer_output_file, 'w') as f:
+            f.write(result.tokens_xml)
+        with open(parser_output_file, 'w') as f:
+            f.write(result.xml)
+
+        return parser_output_file
+
+
+    def _analyze_to_sink(self):
+        # Outputs mirror the input layout inside an output tree or archive. Results are
+        # written as they are compiled, so only one input is held in memory at a time
+        parser_output_files = []
+        sink = open_sink(self.output_path)
+        try:
+            for result in self.compile():
+                name = result.name if self.archive is not None else os.path.relpath(result.name, self.root)
+                basename = os.path.splitext(name)[0]
+                sink.write(basename+'T.xml', result.tokens_xml)
+                parser_output_files.append(sink.write(basename+'.xml', result.xml))
+        finally:
+            sink.close()
 
-            parser_output_files.append(parser_output_file)
-        
         return parser_output_files
 
 
+    def _program_target_dir(self) -> str:
+        # The jack files make up one program, written to target/ in the -j directory (or
+        # next to the -j file)
+        if os.path.isdir(self.target_path):
+            target_dir = os.path.join(self.target_path, 'target')
+        else:
+            target_dir = os.path.join(os.path.dirname(self.target_path), 'target')
+        if not os.path.isdir(target_dir):
+            os.mkdir(target_dir)
+        return target_dir
+
+
+    def generate_vm(self, pool_strings=False, pool_max_words=None):
+        # Writes one .vm file per class (plus StringPool.vm when pooling) to each target dir
+        self._require_files('VM output')
+        results = list(self.compile())
+        string_pool = None
+        if pool_strings:
+            string_pool = StringPool(pool_max_words).collect(r.parser_root for r in results)
+            print(string_pool.report())
+
+        program = generate_program((r.parser_root for r in results), string_pool)
+        target_dir = self._program_target_dir()
+
+        vm_output_files = []
+        for class_name, instructions in program.items():
+            vm_output_file = os.path.join(target_dir, class_name+'.vm')
+            with open(vm_output_file, 'w') as f:
+                f.write(vm_text(instructions))
+            vm_output_files.append(vm_output_file)
+
+        return vm_output_files
+
+
+    def build(self, emit_vm=False, emit_asm=False, bootstrap=True, os_dir=None, pool_strings=False, pool_max_words=None):
+        # Jack -> VM -> Hack assembly -> .hack binary in one process. Only the .hack file is
+        # written unless the intermediate .vm/.asm files are asked for
+        self._require_files('Building')
+        pipeline = Pipeline(bootstrap, read_os_dir(os_dir) if os_dir else None)
+
+        start = time.perf_counter()
+        sources = list(self._read_sources(verbose=False))
+        pipeline.timings['read'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        parser_roots = [result.parser_root for result in compile_many(sources, self.workers, self.lexer)]
+        pipeline.timings['parse'] += time.perf_counter() - start
+
+        if pool_strings:
+            pipeline.string_pool = StringPool(pool_max_words).collect(parser_roots)
+            print(pipeline.string_pool.report())
+        binary = pipeline.run(parser_roots)
+
+        start = time.perf_counter()
+        target_dir = self._program_target_dir()
+        program_name = os.path.splitext(os.path.basename(os.path.normpath(self.target_path)))[0]
+
+        output_files = []
+        if emit_vm:
+            for class_name, instructions in pipeline.program.items():
+                output_files.append(os.path.join(target_dir, class_name+'.vm'))
+                with open(output_files[-1], 'w') as f:
+                    f.write(vm_text(instructions))
+        if emit_asm:
+            output_files.append(os.path.join(target_dir, program_name+'.asm'))
+            with open(output_files[-1], 'w') as f:
+                f.write('\n'.join(pipeline.asm) + '\n')
+        output_files.append(os.path.join(target_dir, program_name+'.hack'))
+        with open(output_files[-1], 'w') as f:
+            f.write('\n'.join(binary) + '\n')
+        pipeline.timings['write'] += time.perf_counter() - start
+
+        return output_files, pipeline
+
+
 class TextComparer:
     def __init__(self, compare_file_path):
         if os.path.isdir(compare_file_path):
@@ -83,58 +215,89 @@ class TextComparer:
         self.compare_files.sort()
 
         for output_file, compare_file in zip(output_files, self.compare_files):
-            print(f'Comparing "{output_file}" with "{compare_file}"...')
-            
-            with open(output_file, 'r') as f:
-                output_lines = f.readlines()
-            with open(compare_file, 'r') as f:
-                compare_lines = f.readlines()
-
-            comparison_failure = False
-            for l_index, (l_output, l_compare) in enumerate(zip(output_lines, compare_lines)):
-                open_tag_pattern = '<([^/].*?)>'
-                open_output = re.search(open_tag_pattern, l_output)
-                open_compare = re.search(open_tag_pattern, l_compare)
-                if open_output is not None:
-                    if open_compare is None or open_output.group(1) != open_compare.group(1):
-                        comparison_failure = True
-                        print(f'Comparison failure at line {l_index} in file {output_file}')
-                        print(f'Output line: {l_output}')
-                        print(f'Compare line: {l_compare}\n')
-                        break
-
-                tag_text_pattern = '>(.*)<'
-                text_output = re.search(tag_text_pattern, l_output)
-                text_compare = re.search(tag_text_pattern, l_compare)
-                if text_output is not None:
-                    if text_compare is None or text_output.group(1).strip() != text_compare.group(1).strip():
-                        comparison_failure = True
-                        print(f'Comparison failure at line {l_index} in file {output_file}')
-                        print(f'Output line: {l_output}')
-                        print(f'Compare line: {l_compare}\n')
-                        break
-
-                close_tag_pattern = '</(.*)>'
-                close_output = re.search(close_tag_pattern, l_output)
-                close_compare = re.search(close_tag_pattern, l_compare)
-                if close_output is not None:
-                    if close_compare is None or close_output.group(1) != close_compare.group(1):
-                        comparison_failure = True
-                        print(f'Comparison failure at line {l_index} in file {output_file}')
-                        print(f'Output line: {l_output}')
-                        print(f'Compare line: {l_compare}\n')
-                        break
-            
-            if not comparison_failure:
-                print('Success!')
+            self.compare_file(output_file, compare_file)
+
+
+    def matching_file(self, output_file: str):
+        # the compare file with the same name as output_file, if there is one
+        basename = os.path.basename(output_file)
+        return next((f for f in self.compare_files if os.path.basename(f) == basename), None)
+
+
+    def compare_file(self, output_file: str, compare_file: str) -> bool:
+        print(f'Comparing "{output_file}" with "{compare_file}"...')
+        
+        with open(output_file, 'r') as f:
+            output_lines = f.readlines()
+        with open(compare_file, 'r') as f:
+            compare_lines = f.readlines()
+
+        for l_index, (l_output, l_compare) in enumerate(zip(output_lines, compare_lines)):
+            open_tag_pattern = '<([^/].*?)>'
+            open_output = re.search(open_tag_pattern, l_output)
+            open_compare = re.search(open_tag_pattern, l_compare)
+            if open_output is not None:
+                if open_compare is None or open_output.group(1) != open_compare.group(1):
+                    print(f'Comparison failure at line {l_index} in file {output_file}')
+                    print(f'Output line: {l_output}')
+                    print(f'Compare line: {l_compare}\n')
+                    return False
+
+            tag_text_pattern = '>(.*)<'
+            text_output = re.search(tag_text_pattern, l_output)
+            text_compare = re.search(tag_text_pattern, l_compare)
+            if text_output is not None:
+                if text_compare is None or text_output.group(1).strip() != text_compare.group(1).strip():
+                    print(f'Comparison failure at line {l_index} in file {output_file}')
+                    print(f'Output line: {l_output}')
+                    print(f'Compare line: {l_compare}\n')
+                    return False
+
+            close_tag_pattern = '</(.*)>'
+            close_output = re.search(close_tag_pattern, l_output)
+            close_compare = re.search(close_tag_pattern, l_compare)
+            if close_output is not None:
+                if close_compare is None or close_output.group(1) != close_compare.group(1):
+                    print(f'Comparison failure at line {l_index} in file {output_file}')
+                    print(f'Output line: {l_output}')
+                    print(f'Compare line: {l_compare}\n')
+                    return False
+        
+        print('Success!')
+        return True
+
+
+def check_build(jack_dir: str, expected: dict, workers=None, lexer='python') -> bool:
+    # Builds jack_dir to a .hack binary, runs it on a Hack CPU and compares the final
+    # values of the expected static variables (as 'Class.index')
+    output_files, pipeline = Analyzer(jack_dir, workers, lexer=lexer).build()
+    hack_file = output_files[-1]
+    print(f'Running "{hack_file}" on the Hack CPU emulator...')
+    with open(hack_file) as f:
+        cpu = HackCPU(f.read().split())
+    cpu.run()
+
+    for static, value in expected.items():
+        actual = signed(cpu.ram[pipeline.symbols[static]])
+        if actual != value:
+            print(f'Build test failure: {static} is {actual}, expected {value}\n')
+            return False
+    print('Success!')
+    return True
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'command',
+        nargs='?',
+        choices=['bench'],
+        help='Optional command. "bench" runs the performance benchmark and compares it to a baseline'
+    )
     parser.add_argument(
         '-j',
         '--jack_files',
-        help='Jack file (with .jack extension) or directory containing Jack files'
+        help='Jack file (with .jack extension), directory containing Jack files, or tar/zip archive'
     )
     parser.add_argument(
         '-c',
@@ -144,22 +307,192 @@ if __name__ == '__main__':
     parser.add_argument(
         '-t',
         '--testall',
-        help='Test the Jack analyzer on the seven provided .jack files',
+        help='Test the Jack analyzer on the seven provided .jack files, and build BuildTest and run it on a Hack CPU emulator',
+        action='store_true'
+    )
+    parser.add_argument(
+        '-r',
+        '--recursive',
+        help='Find Jack files in nested directories of the -j directory too',
+        action='store_true'
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        help='Write the xml files to this directory tree, or .zip/.tar(.gz) archive, mirroring the input layout'
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        help='Worker processes for lexing and parsing large classes in parallel, split at their subroutines'
+    )
+    parser.add_argument(
+        '--lexer',
+        default='python',
+        choices=LEXERS,
+        help='Lexer for Jack sources: "numpy" lexes whole files with vectorized NumPy operations, '
+             '"auto" does so for large files only (falls back to "python" without NumPy)'
+    )
+    parser.add_argument(
+        '--watch',
+        help='Keep running and re-analyze (and with -c re-compare) only the jack files that change',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--debounce',
+        type=float,
+        default=DEBOUNCE,
+        help=f'With --watch, seconds without further saves before re-analyzing (default {DEBOUNCE})'
+    )
+    parser.add_argument(
+        '--vm',
+        help='Compile to VM code, writing one .vm file per class to the target directory',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--pool-strings',
+        help='Build string constants once at startup in a StringPool class instead of at every use. '
+             'Pooled strings are shared between their uses, so the program must not modify or dispose them',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--pool-max-words',
+        type=int,
+        help='Heap words the string pool may use; strings beyond the budget stay inline'
+    )
+    parser.add_argument(
+        '--build',
+        help='Build a Hack binary (.hack) in one process: Jack -> VM -> assembly -> binary',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--emit-vm',
+        help='With --build, also write the intermediate .vm files',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--emit-asm',
+        help='With --build, also write the intermediate .asm file',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--no-bootstrap',
+        help='With --build, leave out the bootstrap code (SP=256, call Sys.init)',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--os-dir',
+        help='Directory of Jack OS .vm files to link into the --build'
+    )
+    parser.add_argument(
+        '--run',
+        help='Execute the Jack program directly from its parse trees, starting at Main.main',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--input',
+        action='append',
+        default=[],
+        help='Line of keyboard input for Keyboard.readLine/readInt when running (repeatable)'
+    )
+    parser.add_argument(
+        '--keys',
+        type=int,
+        nargs='*',
+        default=[],
+        help='Key codes Keyboard.keyPressed/readChar return in order when running'
+    )
+    parser.add_argument(
+        '--profile',
+        help='Count executed statements and subroutine calls when running',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--cost',
+        help='Report a static VM cost estimate for each subroutine instead of writing xml files',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--json',
+        help='Print the --cost report as JSON instead of a table',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--sort',
+        default='estimated_cost',
+        choices=SORT_KEYS,
+        help='Column to sort the --cost report by (descending)'
+    )
+    bench_group = parser.add_argument_group('bench options')
+    bench_group.add_argument(
+        '--baseline',
+        help='Benchmark baseline file to compare against, recorded if it does not exist '
+             '(default: bench_baseline.json next to analyzer.py)'
+    )
+    bench_group.add_argument(
+        '--record',
+        help='Record a new benchmark baseline instead of comparing to the existing one',
+        action='store_true'
+    )
+    bench_group.add_argument(
+        '--scale',
+        type=int,
+        default=1,
+        help='Size multiplier for the synthetic part of the benchmark workload'
+    )
+    bench_group.add_argument(
+        '--repeats',
+        type=int,
+        default=5,
+        help='Number of timed benchmark runs per metric'
+    )
+    bench_group.add_argument(
+        '--time-threshold',
+        type=float,
+        help='Allowed per-stage slowdown as a fraction of the baseline (default 0.10)'
+    )
+    bench_group.add_argument(
+        '--throughput-threshold',
+        type=float,
+        help='Allowed throughput drop as a fraction of the baseline (default 0.10)'
+    )
+    bench_group.add_argument(
+        '--memory-threshold',
+        type=float,
+        help='Allowed peak memory growth as a fraction of the baseline (default 0.10)'
+    )
+    bench_group.add_argument(
+        '--lexers',
+        help='Compare the Python and NumPy lexers at several input sizes instead of running the benchmark',
+        action='store_true'
+    )
+    bench_group.add_argument(
+        '--parallel',
+        help='Compare sequential and parallel (-w workers) compilation of a large class instead of running the benchmark',
         action='store_true'
     )
     args = parser.parse_args()
 
-    if args.testall:
+    if args.command == 'bench':
+        from benchmark import run_bench
+        sys.exit(run_bench(args))
+
+    elif args.testall:
         print('Testing all sample Jack files...')
         jack_dirs = ['ArrayTest', 'ExpressionLessSquare', 'Square']
 
         for jack_dir in jack_dirs:
-            analyzer = Analyzer(jack_dir)
+            analyzer = Analyzer(jack_dir, args.workers, lexer=args.lexer)
             output_files = analyzer.analyze()
 
             comparer = TextComparer(jack_dir)
             comparer.compare(output_files)
 
+        # end to end: Jack -> VM -> Hack assembly -> binary, run on a Hack CPU
+        print('Testing the build pipeline on BuildTest...')
+        check_build('BuildTest', BUILD_TEST_STATICS, args.workers, args.lexer)
+
     elif args.compare_files and not args.jack_files:
         print(
             'Error. When providing compare_file(s), also provide a Jack file '
@@ -168,10 +501,86 @@ if __name__ == '__main__':
             '\npython jack_analyzer.py -j Square/Main.jack -c Square/Main.xml'
         )
         
+    elif args.cost:
+        if not args.jack_files:
+            parser.error('--cost needs a Jack file or directory given with "-j"')
+
+        results = list(Analyzer(args.jack_files, args.workers, args.recursive, lexer=args.lexer).compile(verbose=False))
+        string_pool = None
+        if args.pool_strings:
+            string_pool = StringPool(args.pool_max_words).collect(r.parser_root for r in results)
+
+        cost_model = CostModel(results, string_pool)
+        print(cost_model.to_json(args.sort) if args.json else cost_model.to_table(args.sort))
+
+    elif args.build:
+        if not args.jack_files:
+            parser.error('--build needs a Jack file or directory given with "-j"')
+        if args.recursive:
+            parser.error('--build compiles the -j directory as one program and cannot be used with -r')
+
+        try:
+            output_files, pipeline = Analyzer(args.jack_files, args.workers, args.recursive, lexer=args.lexer).build(
+                args.emit_vm, args.emit_asm, not args.no_bootstrap, args.os_dir,
+                args.pool_strings, args.pool_max_words
+            )
+        except ValueError as e:
+            parser.exit(1, f'Build failed. {e}\n')
+        for output_file in output_files:
+            print(f'Wrote {output_file}')
+        print(pipeline.report())
+
+    elif args.run:
+        if not args.jack_files:
+            parser.error('--run needs a Jack file or directory given with "-j"')
+
+        results = Analyzer(args.jack_files, args.workers, args.recursive, lexer=args.lexer).compile(verbose=False)
+        try:
+            executor = Executor((r.parser_root for r in results), args.keys, args.input, args.profile)
+        except JackError as e:
+            parser.exit(1, f'Run failed. {e}\n')
+        try:
+            executor.run()
+        except JackError as e:
+            print(executor.output)
+            parser.exit(1, f'Run failed. {e}\n')
+        print(executor.output)
+        if args.profile:
+            print(executor.report())
+
+    elif args.vm:
+        if not args.jack_files:
+            parser.error('--vm needs a Jack file or directory given with "-j"')
+        if args.recursive:
+            parser.error('--vm compiles the -j directory as one program and cannot be used with -r')
+
+        try:
+            vm_output_files = Analyzer(args.jack_files, args.workers, args.recursive, lexer=args.lexer).generate_vm(
+                args.pool_strings, args.pool_max_words
+            )
+        except ValueError as e:
+            parser.exit(1, f'VM code generation failed. {e}\n')
+        for vm_output_file in vm_output_files:
+            print(f'Wrote {vm_output_file}')
+
     elif args.jack_files:
-        jack_analyzer = Analyzer(args.jack_files)
-        output_files = jack_analyzer.analyze()
+        # without -o, the outputs of an archive go to a matching archive
+        if args.compare_files and is_archive(args.output or args.jack_files):
+            parser.error('Comparing needs the output written to files, not an archive')
 
-        if args.compare_files:
-            comparer = TextComparer(args.compare_files)
-            comparer.compare(output_files)
+        if args.watch and (args.output or is_archive(args.jack_files)):
+            parser.error('--watch writes the xml files next to the jack files and cannot be used with -o or an archive')
+
+        jack_analyzer = Analyzer(args.jack_files, args.workers, args.recursive, args.output, args.lexer)
+        if args.watch:
+            comparer = TextComparer(args.compare_files) if args.compare_files else None
+            Watcher(jack_analyzer, comparer, debounce=args.debounce).watch()
+        else:
+            try:
+                output_files = jack_analyzer.analyze()
+            except ValueError as e:
+                parser.exit(1, f'Analyzing failed. {e}\n')
+
+            if args.compare_files:
+                comparer = TextComparer(args.compare_files)
+                comparer.compare(output_files)
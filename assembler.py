@@ -0,0 +1,89 @@
+PREDEFINED_SYMBOLS = {
+    'SP': 0, 'LCL': 1, 'ARG': 2, 'THIS': 3, 'THAT': 4,
+    'SCREEN': 16384, 'KBD': 24576,
+    **{f'R{i}': i for i in range(16)},
+}
+VARIABLE_BASE = 16
+
+COMP_CODES = {
+    '0': '0101010', '1': '0111111', '-1': '0111010',
+    'D': '0001100', 'A': '0110000', 'M': '1110000',
+    '!D': '0001101', '!A': '0110001', '!M': '1110001',
+    '-D': '0001111', '-A': '0110011', '-M': '1110011',
+    'D+1': '0011111', 'A+1': '0110111', 'M+1': '1110111',
+    'D-1': '0001110', 'A-1': '0110010', 'M-1': '1110010',
+    'D+A': '0000010', 'D+M': '1000010', 'A+D': '0000010', 'M+D': '1000010',
+    'D-A': '0010011', 'D-M': '1010011',
+    'A-D': '0000111', 'M-D': '1000111',
+    'D&A': '0000000', 'D&M': '1000000', 'A&D': '0000000', 'M&D': '1000000',
+    'D|A': '0010101', 'D|M': '1010101', 'A|D': '0010101', 'M|D': '1010101',
+}
+JUMP_CODES = {
+    '': '000', 'JGT': '001', 'JEQ': '010', 'JGE': '011',
+    'JLT': '100', 'JNE': '101', 'JLE': '110', 'JMP': '111',
+}
+
+
+def _dest_code(dest: str) -> str:
+    return ('1' if 'A' in dest else '0') + ('1' if 'D' in dest else '0') + ('1' if 'M' in dest else '0')
+
+
+class Assembler:
+    # Assembles Hack assembly lines (as VMTranslator produces them, or read from an
+    # .asm file) into 16-character binary instruction strings
+    def __init__(self):
+        self.symbols = dict(PREDEFINED_SYMBOLS)
+        self.next_variable = VARIABLE_BASE
+        # C-instructions repeat heavily, so each distinct one is encoded once
+        self.c_instruction_cache = {}
+
+
+    def assemble(self, asm: list) -> list:
+        # first pass: label addresses
+        instructions = []
+        for line in asm:
+            line = line.split('//')[0].strip()
+            if not line:
+                continue
+            if line.startswith('('):
+                self.symbols[line[1:-1]] = len(instructions)
+            else:
+                instructions.append(line)
+
+        # second pass: encode, allocating variables on first use
+        binary = []
+        for instruction in instructions:
+            if instruction.startswith('@'):
+                binary.append(self._a_instruction(instruction[1:]))
+            else:
+                code = self.c_instruction_cache.get(instruction)
+                if code is None:
+                    code = self.c_instruction_cache[instruction] = self._c_instruction(instruction)
+                binary.append(code)
+
+        return binary
+
+
+    def _a_instruction(self, symbol: str) -> str:
+        if symbol.isdigit():
+            value = int(symbol)
+        else:
+            value = self.symbols.get(symbol)
+            if value is None:
+                value = self.symbols[symbol] = self.next_variable
+                self.next_variable += 1
+        if value > 32767:
+            raise ValueError(f'A-instruction value out of range: @{symbol}')
+        return format(value, '016b')
+
+
+    def _c_instruction(self, instruction: str) -> str:
+        dest, comp, jump = '', instruction, ''
+        if '=' in comp:
+            dest, comp = comp.split('=', 1)
+        if ';' in comp:
+            comp, jump = comp.split(';', 1)
+
+        if comp not in COMP_CODES or jump not in JUMP_CODES:
+            raise ValueError(f'Invalid C-instruction: {instruction}')
+        return '111' + COMP_CODES[comp] + _dest_code(dest) + JUMP_CODES[jump]
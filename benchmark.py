@@ -0,0 +1,373 @@
+import os
+import json
+import time
+import platform
+import statistics
+import tracemalloc
+
+from tokenizer import Tokenizer
+from compiler import compile_many
+
+SAMPLE_DIRS = ['ArrayTest', 'ExpressionLessSquare', 'Square']
+STAGES = ['tokenize', 'tokens_xml', 'parse', 'parse_xml']
+
+# Default allowed slowdown (as a fraction of the baseline) before a metric is a regression
+DEFAULT_THRESHOLDS = {
+    'time': 0.10,
+    'throughput': 0.10,
+    'memory': 0.10,
+}
+
+# A change must also exceed this many (scaled) MADs of combined noise to count
+NOISE_FACTOR = 3.0
+# Scales a median absolute deviation to be comparable to a standard deviation
+MAD_SCALE = 1.4826
+
+# Subroutines per synthetic class for the lexer comparison, roughly 6 KB to 3 MB of source
+LEXER_SIZES = [10, 100, 1000, 5000]
+# Subroutines of the synthetic class for the parallel comparison, about 1.1 MB of source
+PARALLEL_SUBROUTINES = 2000
+
+
+def synthetic_class(class_name: str, n_subroutines: int) -> str:
+    # Deterministic Jack class exercising every statement and term kind
+    lines = [
+        f'/** Generated benchmark class {class_name}. */',
+        f'class {class_name} {{',
+        '    static int count;',
+        '    field int x, y;',
+        '    field Array data;',
+        '',
+        f'    constructor {class_name} new(int ax, int ay) {{',
+        '        let x = ax;',
+        '        let y = ay;',
+        '        let data = Array.new(16);',
+        '        return this;',
+        '    }',
+    ]
+    for i in range(n_subroutines):
+        lines.extend([
+            '',
+            f'    // subroutine {i}',
+            f'    method int step{i}(int n, boolean flag) {{',
+            '        var int i, sum;',
+            '        var String s;',
+            '        let i = 0;',
+            '        let sum = 0;',
+            f'        let s = "step {i}";',
+            '        while (i < n) {',
+            '            if (flag & ~(i = 3)) {',
+            f'                let sum = sum + (i * {i % 7 + 1}) - (x / 2);',
+            '                let data[i] = data[i - 1] + y;',
+            '            }',
+            '            else {',
+            '                do Output.printString(s);',
+            '                let flag = true;',
+            '            }',
+            '            let i = i + 1;',
+            '        }',
+            '        let count = count + 1;',
+            '        return sum;',
+            '    }',
+        ])
+    lines.extend(['}', ''])
+    return '\n'.join(lines)
+
+
+def synthetic_corpus(scale: int) -> list:
+    # One small, one medium and one large class, all growing with scale
+    return [
+        (class_name, synthetic_class(class_name, n_subroutines * scale))
+        for class_name, n_subroutines in [('BenchSmall', 2), ('BenchMedium', 20), ('BenchLarge', 100)]
+    ]
+
+
+def sample_sources(root_dir: str) -> list:
+    sources = []
+    for sample_dir in SAMPLE_DIRS:
+        sample_dir = os.path.join(root_dir, sample_dir)
+        if not os.path.isdir(sample_dir):
+            continue
+        for jack_file in sorted(f for f in os.listdir(sample_dir) if f.endswith('.jack')):
+            with open(os.path.join(sample_dir, jack_file)) as f:
+                sources.append((jack_file, f.read()))
+
+    return sources
+
+
+def run_stages(sources: list, timings: dict) -> int:
+    # Compiles the sources through compiler.compile_many, as the analyzer does, and reads
+    # both xml outputs. compile_many adds each stage's time to timings
+    n_tokens = 0
+    for result in compile_many(sources, timings=timings):
+        result.tokens_xml
+        result.xml
+        n_tokens += len(result.tokens)
+    return n_tokens
+
+
+def summarize(samples: list) -> dict:
+    median = statistics.median(samples)
+    mad = statistics.median(abs(s - median) for s in samples)
+    return {'median': median, 'mad': mad, 'samples': samples}
+
+
+class Benchmark:
+    def __init__(self, root_dir: str = '.', scale: int = 1, repeats: int = 5, thresholds: dict = None):
+        if repeats < 1:
+            raise ValueError('Benchmark needs at least one repeat')
+        if scale < 1:
+            raise ValueError('Benchmark scale must be a positive integer')
+
+        self.root_dir = root_dir
+        self.scale = scale
+        self.repeats = repeats
+        self.thresholds = dict(DEFAULT_THRESHOLDS)
+        if thresholds:
+            self.thresholds.update({k: v for k, v in thresholds.items() if v is not None})
+
+
+    def _run_once(self, sources: list) -> tuple:
+        timings = {stage: 0.0 for stage in STAGES}
+        n_tokens = run_stages(sources, timings)
+        return timings, n_tokens
+
+
+    def run(self) -> dict:
+        sources = sample_sources(self.root_dir) + synthetic_corpus(self.scale)
+        n_bytes = sum(len(source.encode('utf-8')) for _, source in sources)
+
+        # warm-up pass so imports and caches do not skew the first sample
+        self._run_once(sources)
+
+        stage_samples = {stage: [] for stage in STAGES}
+        throughput_samples = []
+        for _ in range(self.repeats):
+            timings, n_tokens = self._run_once(sources)
+            for stage, seconds in timings.items():
+                stage_samples[stage].append(seconds)
+            throughput_samples.append(n_tokens / sum(timings.values()))
+
+        # peak memory is measured in passes of its own since tracing slows everything down
+        memory_samples = []
+        for _ in range(self.repeats):
+            tracemalloc.start()
+            self._run_once(sources)
+            memory_samples.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'scale': self.scale,
+                'repeats': self.repeats,
+                'files': len(sources),
+                'bytes': n_bytes,
+                'tokens': n_tokens,
+            },
+            'stages': {stage: summarize(samples) for stage, samples in stage_samples.items()},
+            'throughput': summarize(throughput_samples),
+            'peak_memory': summarize(memory_samples),
+        }
+
+
+    def record(self, baseline_file: str) -> dict:
+        results = self.run()
+        with open(baseline_file, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Recorded benchmark baseline to {baseline_file}')
+        self.print_results(results)
+
+        return results
+
+
+    def _check(self, name: str, kind: str, baseline: dict, current: dict, higher_is_better: bool) -> dict:
+        base, cur = baseline['median'], current['median']
+        change = (cur - base) / base if base else 0.0
+        slowdown = -change if higher_is_better else change
+        noise = NOISE_FACTOR * MAD_SCALE * (baseline['mad'] + current['mad'])
+
+        regressed = slowdown > self.thresholds[kind] and abs(cur - base) > noise
+        return {
+            'name': name,
+            'kind': kind,
+            'baseline': base,
+            'current': cur,
+            'change': change,
+            'slowdown': slowdown,
+            'regressed': regressed,
+        }
+
+
+    def compare(self, baseline_file: str) -> bool:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+
+        if baseline['meta']['scale'] != self.scale:
+            raise ValueError(
+                f'Baseline was recorded with scale {baseline["meta"]["scale"]}, '
+                f'not {self.scale}. Re-record it or pass a matching --scale.'
+            )
+
+        current = self.run()
+        checks = [
+            self._check(f'stage:{stage}', 'time', baseline['stages'][stage], current['stages'][stage], False)
+            for stage in STAGES
+        ]
+        checks.append(self._check('throughput', 'throughput', baseline['throughput'], current['throughput'], True))
+        checks.append(self._check('peak_memory', 'memory', baseline['peak_memory'], current['peak_memory'], False))
+
+        print(f'Comparing benchmark against baseline {baseline_file}...')
+        print(f'{"metric":<20}{"baseline":>14}{"current":>14}{"change":>10}  status')
+        for check in checks:
+            status = 'REGRESSION' if check['regressed'] else 'ok'
+            print(
+                f'{check["name"]:<20}{self._format(check["kind"], check["baseline"]):>14}'
+                f'{self._format(check["kind"], check["current"]):>14}{check["change"]:>+10.1%}  {status}'
+            )
+
+        regressions = [check for check in checks if check['regressed']]
+        if not regressions:
+            print('No regressions.')
+            return True
+
+        stage_regressions = [check for check in regressions if check['kind'] == 'time']
+        worst = max(stage_regressions or regressions, key=lambda check: check['slowdown'])
+        print(
+            f'Regression detected. Worst offender: {worst["name"]} '
+            f'({worst["slowdown"]:+.1%} worse than baseline, threshold {self.thresholds[worst["kind"]]:.0%})'
+        )
+        return False
+
+
+    def _format(self, kind: str, value: float) -> str:
+        if kind == 'time':
+            return f'{value * 1000:.2f} ms'
+        elif kind == 'throughput':
+            return f'{value:,.0f} tok/s'
+        else:
+            return f'{value / 1024:,.0f} KiB'
+
+
+    def print_results(self, results: dict):
+        meta = results['meta']
+        print(f'{meta["files"]} files, {meta["bytes"]:,} bytes, {meta["tokens"]:,} tokens, {meta["repeats"]} repeats')
+        for stage in STAGES:
+            print(f'{"stage:"+stage:<20}{self._format("time", results["stages"][stage]["median"]):>14}')
+        print(f'{"throughput":<20}{self._format("throughput", results["throughput"]["median"]):>14}')
+        print(f'{"peak_memory":<20}{self._format("memory", results["peak_memory"]["median"]):>14}')
+
+
+def compare_lexers(sizes: list = None, repeats: int = 5) -> bool:
+    # Median tokenize time of the Python and NumPy lexers on synthetic classes of growing size
+    import bulk_lexer
+    if not bulk_lexer.available():
+        print('NumPy is not installed, only the Python lexer is available.')
+        return False
+
+    print(f'{"bytes":>12}{"tokens":>10}{"python":>14}{"numpy":>14}{"speedup":>10}  tokens')
+    identical = True
+    for n_subroutines in sizes or LEXER_SIZES:
+        source = synthetic_class('BenchLexer', n_subroutines)
+        timings = {}
+        tokens = {}
+        for lexer in ['python', 'numpy']:
+            samples = []
+            # first run is a warm-up
+            for _ in range(repeats + 1):
+                start = time.perf_counter()
+                tokens[lexer] = Tokenizer(source=source, lexer=lexer).tokens
+                samples.append(time.perf_counter() - start)
+            timings[lexer] = statistics.median(samples[1:])
+
+        same = tokens['python'] == tokens['numpy']
+        identical = identical and same
+        print(
+            f'{len(source):>12,}{len(tokens["python"]):>10,}'
+            f'{timings["python"] * 1000:>11.2f} ms{timings["numpy"] * 1000:>11.2f} ms'
+            f'{timings["python"] / timings["numpy"]:>9.1f}x  {"identical" if same else "DIFFERENT"}'
+        )
+
+    return identical
+
+
+def compare_parallel(workers: int = None, repeats: int = 3) -> bool:
+    # Median time to compile one large synthetic class, *T.xml and *.xml included,
+    # sequentially and split across worker processes. The part of a parallel run left to
+    # the parent process (parsing the class header and joining the workers' text) bounds
+    # the speed-up, so it is timed on its own too
+    from concurrent.futures import ProcessPoolExecutor
+    from compiler import compile_source
+    import parallel
+
+    workers = workers or os.cpu_count() or 1
+    source = synthetic_class('BenchParallel', PARALLEL_SUBROUTINES)
+
+    def median_time(run) -> float:
+        samples = []
+        # first run is a warm-up
+        for _ in range(repeats + 1):
+            start = time.perf_counter()
+            run()
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples[1:])
+
+    results = {}
+    def sequential():
+        result = compile_source(source)
+        results['sequential'] = (result.tokens, result.tokens_xml, result.xml)
+    sequential_time = median_time(sequential)
+
+    with ProcessPoolExecutor(workers) as executor:
+        def split():
+            results['parallel'] = parallel.compile_parts(source, workers, executor)
+        parallel_time = median_time(split)
+
+    chunks = parallel.split_source(source, workers * parallel.CHUNKS_PER_WORKER)
+    header, chunks = chunks[0], chunks[1:]
+    chunk_results = [
+        parallel._compile_chunk((chunk, index == len(chunks) - 1)) for index, chunk in enumerate(chunks)
+    ]
+    serial_time = median_time(lambda: parallel._stitch(header, chunk_results))
+
+    same = results['sequential'] == tuple(results['parallel'])
+    # Amdahl's law, with the workers' share of the work split evenly
+    bound = sequential_time / (serial_time + (sequential_time - serial_time) / workers)
+    print(f'{len(source):,} bytes, {len(results["sequential"][0]):,} tokens, {workers} workers, {os.cpu_count()} CPUs')
+    print(f'{"sequential":<20}{sequential_time * 1000:>11.1f} ms')
+    print(
+        f'{"parallel":<20}{parallel_time * 1000:>11.1f} ms{sequential_time / parallel_time:>9.2f}x  '
+        f'{"identical" if same else "DIFFERENT"}'
+    )
+    print(f'{"parent serial part":<20}{serial_time * 1000:>11.1f} ms  at most {bound:.2f}x with {workers} CPUs')
+    return same
+
+
+def run_bench(args) -> int:
+    if args.lexers:
+        return 0 if compare_lexers(repeats=args.repeats) else 1
+    if args.parallel:
+        return 0 if compare_parallel(args.workers, args.repeats) else 1
+
+    # the workload and the default baseline both live next to this script, wherever it
+    # is run from
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    baseline = args.baseline or os.path.join(root_dir, 'bench_baseline.json')
+    benchmark = Benchmark(
+        root_dir=root_dir,
+        scale=args.scale,
+        repeats=args.repeats,
+        thresholds={
+            'time': args.time_threshold,
+            'throughput': args.throughput_threshold,
+            'memory': args.memory_threshold,
+        }
+    )
+
+    if args.record or not os.path.isfile(baseline):
+        benchmark.record(baseline)
+        return 0
+
+    return 0 if benchmark.compare(baseline) else 1
+
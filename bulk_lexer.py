@@ -0,0 +1,150 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from tokenizer import SYMBOLS
+
+# Characters str.splitlines breaks ASCII text on, and those str.strip removes
+LINE_BREAKS = b'\n\r\x0b\x0c\x1c\x1d\x1e'
+WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+SLASH, STAR, QUOTE, SPACE = ord('/'), ord('*'), ord('"'), ord(' ')
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _lookup(chars) -> 'np.ndarray':
+    table = np.zeros(256, dtype=bool)
+    table[list(chars)] = True
+    return table
+
+
+if np is not None:
+    IS_BREAK = _lookup(LINE_BREAKS)
+    IS_WHITESPACE = _lookup(WHITESPACE)
+    IS_SYMBOL = _lookup(ord(symbol) for symbol in SYMBOLS)
+
+
+def _pairs(chars, first: int, second: int) -> 'np.ndarray':
+    # positions where first is directly followed by second
+    return np.flatnonzero((chars[:-1] == first) & (chars[1:] == second))
+
+
+def _mask_ranges(n: int, starts, ends) -> 'np.ndarray':
+    # boolean mask covering every [start, end] range
+    delta = np.zeros(n + 1, dtype=np.int32)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, ends + 1, -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+def _strip_line_comments(chars):
+    # everything from the first '//' of a line to its end
+    line_ids = np.cumsum(IS_BREAK[chars])
+    slashes = _pairs(chars, SLASH, SLASH)
+    cut = np.full(line_ids[-1] + 1, len(chars))
+    lines, first = np.unique(line_ids[slashes], return_index=True)
+    cut[lines] = slashes[first]
+    return chars[np.arange(len(chars)) < cut[line_ids]]
+
+
+def _strip_block_comments(chars):
+    # '/*' up to the next '*/' at least one character further on, not nested
+    opens = _pairs(chars, SLASH, STAR)
+    closes = _pairs(chars, STAR, SLASH)
+    starts, ends = [], []
+    position = 0
+    while True:
+        index = np.searchsorted(opens, position)
+        if index == len(opens):
+            break
+        start = opens[index]
+        close_index = np.searchsorted(closes, start + 2)
+        if close_index == len(closes):
+            # runs to the end of the source, the reference lexer fails on this
+            return None
+        starts.append(start)
+        ends.append(closes[close_index] + 1)
+        position = closes[close_index] + 2
+
+    if not starts:
+        return chars
+    return chars[~_mask_ranges(len(chars), np.array(starts), np.array(ends))]
+
+
+def _strip_whitespace(chars):
+    # strip each line and join the lines back together without separators
+    content = np.flatnonzero(~IS_WHITESPACE[chars])
+    if len(content) == 0:
+        return chars[:0]
+    line_ids = np.cumsum(IS_BREAK[chars])
+    content_lines = line_ids[content]
+    line_starts = np.flatnonzero(np.r_[True, content_lines[1:] != content_lines[:-1]])
+    line_ends = np.r_[line_starts[1:] - 1, len(content) - 1]
+
+    n_lines = line_ids[-1] + 1
+    first = np.full(n_lines, len(chars))
+    last = np.full(n_lines, -1)
+    first[content_lines[line_starts]] = content[line_starts]
+    last[content_lines[line_ends]] = content[line_ends]
+
+    positions = np.arange(len(chars))
+    return chars[(positions >= first[line_ids]) & (positions <= last[line_ids])]
+
+
+def bulk_tokens(jack: str):
+    # Same token list as Tokenizer's character-by-character lexer, from whole-array
+    # classification. Returns None when NumPy is missing or the input needs the
+    # reference lexer's exact edge-case behaviour (non-ASCII text, unterminated
+    # comments or strings, quotes glued onto identifiers)
+    if np is None or not jack or not jack.isascii():
+        return None
+
+    chars = np.frombuffer(jack.encode('ascii'), dtype=np.uint8)
+    chars = _strip_line_comments(chars)
+    # the reference lexer fails when its comment-free text is empty or ends on '/' or
+    # '*', it is only ever followed by whitespace, so leave those inputs to it
+    content = np.flatnonzero(~IS_WHITESPACE[chars])
+    if len(content) == 0 or chars[content[-1]] in (SLASH, STAR):
+        return None
+    chars = _strip_block_comments(chars)
+    if chars is None:
+        return None
+    chars = _strip_whitespace(chars)
+    n = len(chars)
+    if n == 0:
+        return []
+
+    # strings: quotes pair up open/close, each opening quote must start a new token
+    quotes = np.flatnonzero(chars == QUOTE)
+    if len(quotes) % 2:
+        return None
+    opens, closes = quotes[::2], quotes[1::2]
+    in_string = _mask_ranges(n, opens, closes) if len(quotes) else np.zeros(n, dtype=bool)
+    before_open = opens[opens > 0] - 1
+    if len(before_open) and not np.all(
+        IS_SYMBOL[chars[before_open]] | (chars[before_open] == SPACE) | (chars[before_open] == QUOTE)
+    ):
+        return None
+
+    # identifiers, keywords and numbers: runs of non-space, non-symbol chars outside strings
+    is_symbol = IS_SYMBOL[chars] & ~in_string
+    is_word = ~(IS_SYMBOL[chars] | (chars == SPACE) | in_string)
+    edges = np.diff(np.r_[False, is_word, False].astype(np.int8))
+    word_starts = np.flatnonzero(edges == 1)
+    word_ends = np.flatnonzero(edges == -1) - 1
+    if len(word_ends) and word_ends[-1] == n - 1:
+        # a token still open at the end of the source is never flushed
+        word_starts, word_ends = word_starts[:-1], word_ends[:-1]
+
+    symbols = np.flatnonzero(is_symbol)
+    starts = np.concatenate([symbols, word_starts, opens])
+    ends = np.concatenate([symbols, word_ends, closes]) + 1
+    order = np.argsort(starts, kind='stable')
+
+    # only slicing the tokens out, and later typing them, is left to Python
+    text = chars.tobytes().decode('ascii')
+    return [text[start:end] for start, end in zip(starts[order].tolist(), ends[order].tolist())]
@@ -0,0 +1,300 @@
+from symbol_table import SEGMENTS, SYMBOL_KEY, SCOPE_KEY, CALL_KEY
+from compilation_engine import children, text
+
+ARITHMETIC_COMMANDS = {
+    '+': ('add',),
+    '-': ('sub',),
+    '*': ('call', 'Math.multiply', 2),
+    '/': ('call', 'Math.divide', 2),
+    '&': ('and',),
+    '|': ('or',),
+    '<': ('lt',),
+    '>': ('gt',),
+    '=': ('eq',),
+}
+UNARY_COMMANDS = {
+    '-': ('neg',),
+    '~': ('not',),
+}
+
+# class holding the pooled string constants, see string_pool.StringPool
+POOL_CLASS = 'StringPool'
+
+
+def vm_text(instructions: list) -> str:
+    return '\n'.join(' '.join(str(part) for part in instruction) for instruction in instructions) + '\n'
+
+
+def generate_program(parser_roots, string_pool=None) -> dict:
+    # VM commands for every class of a program, keyed by class name
+    if string_pool is not None and not string_pool.strings:
+        # nothing pooled, so no StringPool class and no init call either
+        string_pool = None
+
+    program = {}
+    for parser_root in parser_roots:
+        code_generator = CodeGenerator(parser_root, string_pool)
+        if code_generator.class_name in program:
+            raise ValueError(f'Class {code_generator.class_name} is defined more than once')
+        program[code_generator.class_name] = code_generator.generate()
+
+    if string_pool is not None:
+        if not any(i[:2] == ('function', 'Main.main') for i in program.get('Main', [])):
+            raise ValueError(
+                'Pooled strings are built at the start of Main.main, but the program has no Main.main. '
+                'Compile it without --pool-strings.'
+            )
+        if POOL_CLASS in program:
+            raise ValueError(
+                f'The program has its own {POOL_CLASS} class, which the string pool would replace. '
+                'Rename it or compile without --pool-strings.'
+            )
+        program[POOL_CLASS] = string_pool.generate()
+    return program
+
+
+class CodeGenerator:
+    # Generates VM commands from a CompilationEngine parse tree. Commands are tuples
+    # such as ('push', 'constant', 7), ('call', 'Math.multiply', 2) or ('add',).
+    # Variables and calls are not looked up again, the slots and call targets the
+    # engine recorded on the identifier tags are used as they are
+    def __init__(self, class_tag, string_pool=None):
+        if class_tag.nodeType == class_tag.DOCUMENT_NODE:
+            class_tag = class_tag.documentElement
+        self.class_tag = class_tag
+        self.class_name = text(children(class_tag)[1])
+        self.class_table = class_tag.getUserData(SCOPE_KEY)
+        # an empty pool leaves every string constant inline
+        self.string_pool = string_pool if string_pool is not None and string_pool.strings else None
+
+
+    def generate(self) -> list:
+        instructions = []
+        for _, subroutine_instructions in self.generate_subroutines():
+            instructions.extend(subroutine_instructions)
+        return instructions
+
+
+    def generate_subroutines(self):
+        for subroutine_tag in children(self.class_tag):
+            if subroutine_tag.tagName == 'subroutineDec':
+                yield self.compile_subroutine(subroutine_tag)
+
+
+    def compile_subroutine(self, subroutine_tag) -> tuple:
+        tags = children(subroutine_tag)
+        kind, name = text(tags[0]), text(tags[2])
+        body_tags = children(tags[6])
+        self.label_counts = {'IF': 0, 'WHILE': 0}
+
+        full_name = f'{self.class_name}.{name}'
+        instructions = [('function', full_name, subroutine_tag.getUserData(SCOPE_KEY)['var'])]
+        if self.string_pool is not None and full_name == 'Main.main':
+            # build the pooled strings before the program starts
+            instructions.append(('call', f'{POOL_CLASS}.init', 0))
+            instructions.append(('pop', 'temp', 0))
+        if kind == 'constructor':
+            instructions.append(('push', 'constant', self.class_table.var_count('field')))
+            instructions.append(('call', 'Memory.alloc', 1))
+            instructions.append(('pop', 'pointer', 0))
+        elif kind == 'method':
+            instructions.append(('push', 'argument', 0))
+            instructions.append(('pop', 'pointer', 0))
+
+        statements_tag = [tag for tag in body_tags if tag.tagName == 'statements'][0]
+        self.compile_statements(statements_tag, instructions)
+
+        return full_name, instructions
+
+
+    def _label(self, prefix: str) -> int:
+        index = self.label_counts[prefix]
+        self.label_counts[prefix] += 1
+        return index
+
+
+    def _symbol(self, name_tag) -> tuple:
+        symbol = name_tag.getUserData(SYMBOL_KEY)
+        if symbol is None:
+            raise ValueError(f'Undefined variable {text(name_tag)} in class {self.class_name}')
+        return symbol
+
+
+    def _push_var(self, name_tag, instructions: list):
+        _, kind, index = self._symbol(name_tag)
+        instructions.append(('push', SEGMENTS[kind], index))
+
+
+    def _pop_var(self, name_tag, instructions: list):
+        _, kind, index = self._symbol(name_tag)
+        instructions.append(('pop', SEGMENTS[kind], index))
+
+
+    def compile_statements(self, statements_tag, instructions: list):
+        for statement_tag in children(statements_tag):
+            statement = statement_tag.tagName
+            if statement == 'letStatement':
+                self.compile_let(statement_tag, instructions)
+            elif statement == 'doStatement':
+                self.compile_do(statement_tag, instructions)
+            elif statement == 'whileStatement':
+                self.compile_while(statement_tag, instructions)
+            elif statement == 'ifStatement':
+                self.compile_if(statement_tag, instructions)
+            elif statement == 'returnStatement':
+                self.compile_return(statement_tag, instructions)
+            else:
+                raise ValueError(f'Unknown statement: {statement}')
+
+
+    def compile_let(self, let_tag, instructions: list):
+        tags = children(let_tag)
+
+        if text(tags[2]) == '[':
+            # let varName '[' expression ']' '=' expression ';'
+            self._push_var(tags[1], instructions)
+            self.compile_expression(tags[3], instructions)
+            instructions.append(('add',))
+            self.compile_expression(tags[6], instructions)
+            instructions.append(('pop', 'temp', 0))
+            instructions.append(('pop', 'pointer', 1))
+            instructions.append(('push', 'temp', 0))
+            instructions.append(('pop', 'that', 0))
+        else:
+            # let varName '=' expression ';'
+            self.compile_expression(tags[3], instructions)
+            self._pop_var(tags[1], instructions)
+
+
+    def compile_do(self, do_tag, instructions: list):
+        # drop 'do' and ';', leaving a subroutineCall
+        self.compile_subroutine_call(children(do_tag)[1:-1], instructions)
+        instructions.append(('pop', 'temp', 0))
+
+
+    def compile_while(self, while_tag, instructions: list):
+        tags = children(while_tag)
+        index = self._label('WHILE')
+
+        instructions.append(('label', f'WHILE_EXP{index}'))
+        self.compile_expression(tags[2], instructions)
+        instructions.append(('not',))
+        instructions.append(('if-goto', f'WHILE_END{index}'))
+        self.compile_statements(tags[5], instructions)
+        instructions.append(('goto', f'WHILE_EXP{index}'))
+        instructions.append(('label', f'WHILE_END{index}'))
+
+
+    def compile_if(self, if_tag, instructions: list):
+        tags = children(if_tag)
+        index = self._label('IF')
+        has_else = len(tags) > 7
+
+        self.compile_expression(tags[2], instructions)
+        instructions.append(('if-goto', f'IF_TRUE{index}'))
+        instructions.append(('goto', f'IF_FALSE{index}'))
+        instructions.append(('label', f'IF_TRUE{index}'))
+        self.compile_statements(tags[5], instructions)
+        if has_else:
+            instructions.append(('goto', f'IF_END{index}'))
+        instructions.append(('label', f'IF_FALSE{index}'))
+        if has_else:
+            self.compile_statements(tags[9], instructions)
+            instructions.append(('label', f'IF_END{index}'))
+
+
+    def compile_return(self, return_tag, instructions: list):
+        tags = children(return_tag)
+        if tags[1].tagName == 'expression':
+            self.compile_expression(tags[1], instructions)
+        else:
+            # void subroutines return 0
+            instructions.append(('push', 'constant', 0))
+        instructions.append(('return',))
+
+
+    def compile_expression(self, expression_tag, instructions: list):
+        # term (op term)*
+        tags = children(expression_tag)
+        self.compile_term(tags[0], instructions)
+        for op_tag, term_tag in zip(tags[1::2], tags[2::2]):
+            self.compile_term(term_tag, instructions)
+            instructions.append(ARITHMETIC_COMMANDS[text(op_tag)])
+
+
+    def compile_term(self, term_tag, instructions: list):
+        tags = children(term_tag)
+        first = tags[0]
+        token_type, token = first.tagName, text(first)
+
+        if token_type == 'integerConstant':
+            instructions.append(('push', 'constant', int(token)))
+        elif token_type == 'stringConstant':
+            self.compile_string(token, instructions)
+        elif token_type == 'keyword':
+            if token == 'true':
+                instructions.append(('push', 'constant', 0))
+                instructions.append(('not',))
+            elif token == 'this':
+                instructions.append(('push', 'pointer', 0))
+            else:
+                # false and null
+                instructions.append(('push', 'constant', 0))
+        elif token_type == 'symbol' and token == '(':
+            self.compile_expression(tags[1], instructions)
+        elif token_type == 'symbol':
+            # unaryOp term
+            self.compile_term(tags[1], instructions)
+            instructions.append(UNARY_COMMANDS[token])
+        elif len(tags) == 1:
+            self._push_var(first, instructions)
+        elif text(tags[1]) == '[':
+            self._push_var(first, instructions)
+            self.compile_expression(tags[2], instructions)
+            instructions.append(('add',))
+            instructions.append(('pop', 'pointer', 1))
+            instructions.append(('push', 'that', 0))
+        else:
+            self.compile_subroutine_call(tags, instructions)
+
+
+    def compile_string(self, string: str, instructions: list):
+        pool_index = self.string_pool.index_of(string) if self.string_pool is not None else None
+        if pool_index is not None:
+            instructions.append(('push', 'constant', pool_index))
+            instructions.append(('call', f'{POOL_CLASS}.get', 1))
+            return
+
+        instructions.append(('push', 'constant', len(string)))
+        instructions.append(('call', 'String.new', 1))
+        for char in string:
+            instructions.append(('push', 'constant', ord(char)))
+            instructions.append(('call', 'String.appendChar', 2))
+
+
+    def compile_subroutine_call(self, tags: list, instructions: list):
+        # subroutineName '(' expressionList ')' or
+        # (className | varName) '.' subroutineName '(' expressionList ')'
+        n_args = 0
+        if text(tags[1]) == '.':
+            full_name, kind = tags[2].getUserData(CALL_KEY)
+            if tags[0].getUserData(SYMBOL_KEY) is not None:
+                # method call on an object
+                self._push_var(tags[0], instructions)
+                n_args += 1
+            elif kind == 'method':
+                raise ValueError(f'{full_name} is a method and needs an object, not its class name')
+        else:
+            full_name, kind = tags[0].getUserData(CALL_KEY)
+            if kind not in ['function', 'constructor']:
+                # method call on this
+                instructions.append(('push', 'pointer', 0))
+                n_args += 1
+
+        expression_list_tag = [tag for tag in tags if tag.tagName == 'expressionList'][0]
+        for expression_tag in children(expression_list_tag):
+            if expression_tag.tagName == 'expression':
+                self.compile_expression(expression_tag, instructions)
+                n_args += 1
+
+        instructions.append(('call', full_name, n_args))
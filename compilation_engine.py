@@ -1,13 +1,58 @@
 from xml.dom import minidom
 
+from symbol_table import SymbolTable, SYMBOL_KEY, SCOPE_KEY, CALL_KEY
+
 OP_SYMBOLS = ['+', '-', '*', '/', '&', '|', '<', '>', '=']
 UNARY_OP_SYMBOLS = ['-', '~']
 KEYWORD_CONSTANTS = ['true', 'false', 'null', 'this']
 
+
+def children(tag) -> list:
+    # element children only, skipping the empty text nodes minidom keeps for closing tags
+    return [child for child in tag.childNodes if child.nodeType == child.ELEMENT_NODE]
+
+
+def text(tag) -> str:
+    return tag.firstChild.data if tag.firstChild is not None else ''
+
+
+def pretty_xml(parser_root) -> str:
+    # parse tree as indented xml, without the xml header
+    xml_str = parser_root.toprettyxml(indent='  ')
+    return '\n'.join([l for l in xml_str.splitlines()[1:]])
+
+
+def format_xml(xml_str: str) -> str:
+    # *.xml contents from pretty_xml output, also of a tree pretty printed in pieces
+
+    # format empty tags in two lines instead of one. Every occurrence of a line is replaced
+    # at once, so repeats need no further pass
+    empty_tag_lines = dict.fromkeys(l for l in xml_str.splitlines() if '><' in l)
+    for l in empty_tag_lines:
+        indentation = l.split('<', 1)[0]
+        open_tag = l.split('><')[0]
+        close_tag = l.split('><')[1]
+        xml_str = xml_str.replace(l, open_tag+'>\n'+indentation+'<'+close_tag)
+
+    # get rid of empty lines
+    return '\n'.join([l for l in xml_str.splitlines() if not l.isspace()])
+
+
 class CompilationEngine:
     def __init__(self, tokenizer):
+        # class-level symbol tables of every class compiled so far, by class name. They
+        # outlive reset, so calls into classes from earlier files get the callee's kind
+        self.class_tables = {}
+        self.reset(tokenizer)
+
+
+    def reset(self, tokenizer):
+        # point the engine at a new tokenizer so one engine can compile many inputs
         self.tokenizer = tokenizer
         self.parser_root = minidom.Document()
+        self.symbol_table = SymbolTable()
+        # (name tag, class name, subroutine name) of the current class's calls, see _end_class
+        self.calls = []
 
 
     def _create_tag(self, parent_tag, child, child_text):
@@ -21,6 +66,58 @@ class CompilationEngine:
         return child_tag
 
 
+    def _start_class(self, class_tag, class_name: str):
+        self.symbol_table = SymbolTable(class_name)
+        self.class_tables[class_name] = self.symbol_table
+        class_tag.setUserData(SCOPE_KEY, self.symbol_table, None)
+
+
+    def _end_class(self):
+        # Calls get their callee's kind once the whole class is known, so calls within the
+        # class never depend on declaration order. Classes not compiled yet (or the OS)
+        # leave the kind None
+        for name_tag, class_name, name in self.calls:
+            class_table = self.class_tables.get(class_name)
+            kind = class_table.subroutines.get(name) if class_table is not None else None
+            name_tag.setUserData(CALL_KEY, (f'{class_name}.{name}', kind), None)
+        self.calls = []
+        # only the class-level symbols stay in the class tag's table
+        self.symbol_table.start_subroutine()
+
+
+    def _start_subroutine(self, kind: str, name: str):
+        self.symbol_table.start_subroutine()
+        self.symbol_table.subroutines[name] = kind
+        if kind == 'method':
+            self.symbol_table.define('this', self.symbol_table.class_name, 'arg')
+
+
+    def _end_subroutine(self, subroutine_tag):
+        counts = {kind: self.symbol_table.var_count(kind) for kind in ['arg', 'var']}
+        subroutine_tag.setUserData(SCOPE_KEY, counts, None)
+
+
+    def _declare(self, name_tag, name: str, var_type: str, kind: str):
+        name_tag.setUserData(SYMBOL_KEY, self.symbol_table.define(name, var_type, kind), None)
+
+
+    def _resolve(self, name_tag, name: str):
+        # class names (and undefined variables) are left without a symbol
+        symbol = self.symbol_table.lookup(name)
+        if symbol is not None:
+            name_tag.setUserData(SYMBOL_KEY, symbol, None)
+
+
+    def _resolve_call(self, name_tag, name: str, target_tag=None, target: str = None):
+        # subroutineName of a call on this (no target), an object variable or a class
+        if target_tag is None:
+            class_name = self.symbol_table.class_name
+        else:
+            symbol = target_tag.getUserData(SYMBOL_KEY)
+            class_name = symbol[0] if symbol is not None else target
+        self.calls.append((name_tag, class_name, name))
+
+
     def compile_class(self, token, token_type):
         class_tag = self.parser_root.createElement('class')
         self.parser_root.appendChild(class_tag)
@@ -30,6 +127,7 @@ class CompilationEngine:
         # className
         token, token_type = self.tokenizer.advance()
         self._create_tag(class_tag, token_type, token)
+        self._start_class(class_tag, token)
 
         # '{'
         token, token_type = self.tokenizer.advance()
@@ -41,9 +139,12 @@ class CompilationEngine:
 
         while token != '}':
             # zero or more subroutineDec
+            if token not in ['constructor', 'function', 'method']:
+                raise ValueError(f'Expected a subroutine declaration, got: {token}')
             token, token_type = self.compile_subroutine(class_tag, token, token_type)
         
         self._create_tag(class_tag, token_type, token)
+        self._end_class()
 
 
     def compile_class_var_dec(self, class_tag, token, token_type):
@@ -53,16 +154,19 @@ class CompilationEngine:
         else:
             class_var_dec_tag = self._create_tag(class_tag, 'classVarDec', None)
             self._create_tag(class_var_dec_tag, token_type, token)
+            kind = token
 
             # type
             token, token_type = self.tokenizer.advance()
             self._create_tag(class_var_dec_tag, token_type, token)
+            var_type = token
 
             # one or more varName(s)
             while token != ';': 
                 # varName
                 token, token_type = self.tokenizer.advance()
-                self._create_tag(class_var_dec_tag, token_type, token)
+                name_tag = self._create_tag(class_var_dec_tag, token_type, token)
+                self._declare(name_tag, token, var_type, kind)
 
                 # ',' or ';' 
                 token, token_type = self.tokenizer.advance()
@@ -80,6 +184,7 @@ class CompilationEngine:
         subroutine_tag = self.parser_root.createElement('subroutineDec')
         parent_tag.appendChild(subroutine_tag)
         self._create_tag(subroutine_tag, token_type, token)
+        kind = token
 
         if token == 'function' or token == 'method':
             # type
@@ -93,6 +198,7 @@ class CompilationEngine:
         # subroutineName
         token, token_type = self.tokenizer.advance()
         self._create_tag(subroutine_tag, token_type, token)
+        self._start_subroutine(kind, token)
 
         # '('
         token, token_type = self.tokenizer.advance()
@@ -123,6 +229,7 @@ class CompilationEngine:
 
         # '}' (end of subroutineBody)
         self._create_tag(subroutine_body_tag, token_type, token)
+        self._end_subroutine(subroutine_tag)
 
         token, token_type = self.tokenizer.advance()
         return token, token_type
@@ -136,10 +243,12 @@ class CompilationEngine:
         while token != ')':
             # type
             self._create_tag(parent_tag, token_type, token)
+            var_type = token
         
             # varName
             token, token_type = self.tokenizer.advance()   
-            self._create_tag(parent_tag, token_type, token)   
+            name_tag = self._create_tag(parent_tag, token_type, token)   
+            self._declare(name_tag, token, var_type, 'arg')
             
             token, token_type = self.tokenizer.advance()
             if token == ',':
@@ -161,12 +270,14 @@ class CompilationEngine:
         # type
         token, token_type = self.tokenizer.advance()
         self._create_tag(var_dec_tag, token_type, token)
+        var_type = token
 
         # one or more varNames
         while token != ';': 
             # varName
             token, token_type = self.tokenizer.advance()
-            self._create_tag(var_dec_tag, token_type, token)
+            name_tag = self._create_tag(var_dec_tag, token_type, token)
+            self._declare(name_tag, token, var_type, 'var')
 
             # "," or ";" 
             token, token_type = self.tokenizer.advance()
@@ -207,13 +318,16 @@ class CompilationEngine:
 
         # subroutineName or className (start of subroutineCall)
         token, token_type = self.tokenizer.advance() 
-        self._create_tag(parent_tag, token_type, token)
+        first_tag = self._create_tag(parent_tag, token_type, token)
+        first = token
 
         # '(' or '.'
         token, token_type = self.tokenizer.advance()
         self._create_tag(parent_tag, token_type, token)
 
         if token == '(':
+            self._resolve_call(first_tag, first)
+
             # start expressionList
             token, token_type = self.tokenizer.advance()
             expression_list_tag = self._create_tag(parent_tag, 'expressionList', '')
@@ -221,9 +335,12 @@ class CompilationEngine:
                 expression_list_tag, token, token_type
             )
         elif token == '.':
+            self._resolve(first_tag, first)
+
             # subroutineName
             token, token_type = self.tokenizer.advance()
-            self._create_tag(parent_tag, token_type, token)
+            name_tag = self._create_tag(parent_tag, token_type, token)
+            self._resolve_call(name_tag, token, first_tag, first)
 
             # '('
             token, token_type = self.tokenizer.advance()            
@@ -251,7 +368,8 @@ class CompilationEngine:
 
         # varName
         token, token_type = self.tokenizer.advance()
-        self._create_tag(parent_tag, token_type, token)
+        name_tag = self._create_tag(parent_tag, token_type, token)
+        self._resolve(name_tag, token)
         
         token, token_type = self.tokenizer.advance()
         # check for array indexing
@@ -434,12 +552,14 @@ class CompilationEngine:
 
             if token == '.':
                 # subroutine call
-                self._create_tag(term_tag, initial_token_type, initial_token)
+                target_tag = self._create_tag(term_tag, initial_token_type, initial_token)
+                self._resolve(target_tag, initial_token)
                 self._create_tag(term_tag, token_type, token)
 
                 # subroutine name
                 token, token_type = self.tokenizer.advance()
-                self._create_tag(term_tag, token_type, token)
+                name_tag = self._create_tag(term_tag, token_type, token)
+                self._resolve_call(name_tag, token, target_tag, initial_token)
 
                 # '('
                 token, token_type = self.tokenizer.advance()
@@ -455,7 +575,8 @@ class CompilationEngine:
                 
             elif token == '[':
                 # array indexing
-                self._create_tag(term_tag, initial_token_type, initial_token)
+                array_tag = self._create_tag(term_tag, initial_token_type, initial_token)
+                self._resolve(array_tag, initial_token)
                 self._create_tag(term_tag, token_type, token)
 
                 expression_tag = self._create_tag(term_tag, 'expression', None)
@@ -468,11 +589,13 @@ class CompilationEngine:
 
             elif token == ';' or token == ')' or token == ']' or token == ',':
                 # identifier only
-                self._create_tag(term_tag, initial_token_type, initial_token)
+                name_tag = self._create_tag(term_tag, initial_token_type, initial_token)
+                self._resolve(name_tag, initial_token)
                 return token, token_type
 
             elif token in OP_SYMBOLS:
-                self._create_tag(term_tag, initial_token_type, initial_token)
+                name_tag = self._create_tag(term_tag, initial_token_type, initial_token)
+                self._resolve(name_tag, initial_token)
                 return token, token_type
 
             else:
@@ -507,6 +630,8 @@ class CompilationEngine:
 
             expression_tag = self._create_tag(parent_tag, 'expression', None)
             token, token_type = self.compile_expression(expression_tag, token, token_type)
+            if token not in [',', ')']:
+                raise ValueError(f'Unexpected token in expression list: {token}')
             
             if token == ',':
                 # additional expression
@@ -516,22 +641,12 @@ class CompilationEngine:
         return token, token_type
 
 
-    def wrtie_xml_file(self, output_file: str) -> None:
-        xml_str = self.parser_root.toprettyxml(indent='  ')
+    def to_xml(self) -> str:
+        return format_xml(pretty_xml(self.parser_root))
 
-        # remove xml header
-        xml_str = '\n'.join([l for l in xml_str.splitlines()[1:]])
 
-        # format empty tags in two lines instead of one
-        empty_tag_lines = [l for l in xml_str.splitlines() if '><' in l]
-        for l in empty_tag_lines:
-            indentation = l.split('<', 1)[0]
-            open_tag = l.split('><')[0]
-            close_tag = l.split('><')[1]
-            xml_str = xml_str.replace(l, open_tag+'>\n'+indentation+'<'+close_tag)
-
-        # get rid of empty lines
-        xml_str = '\n'.join([l for l in xml_str.splitlines() if not l.isspace()])
+    def wrtie_xml_file(self, output_file: str) -> None:
+        xml_str = self.to_xml()
 
         # write to file
         with open(output_file, 'w') as f:
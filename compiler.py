@@ -0,0 +1,215 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from tokenizer import Tokenizer
+from compilation_engine import CompilationEngine, pretty_xml, format_xml
+from parallel import compile_parts, PARALLEL_MIN_CHARS
+
+
+class CompileResult:
+    # One compiled class. The tokens, parse tree and *T.xml and *.xml contents (exactly as
+    # the analyzer writes them) are each given either as is, or as a function building
+    # them on first access. Without a name, the class name is used
+    def __init__(self, name, tokens, parser_root, tokens_xml, xml):
+        self._name = name
+        self._parts = {'tokens': tokens, 'parser_root': parser_root, 'tokens_xml': tokens_xml, 'xml': xml}
+
+
+    def _part(self, part: str):
+        value = self._parts[part]
+        if callable(value):
+            value = self._parts[part] = value()
+        return value
+
+
+    @property
+    def name(self) -> str:
+        if self._name is None:
+            self._name = _class_name(self.tokens)
+        return self._name
+
+
+    @property
+    def tokens(self) -> list:
+        return self._part('tokens')
+
+
+    @property
+    def parser_root(self):
+        return self._part('parser_root')
+
+
+    @property
+    def tokens_xml(self) -> str:
+        return self._part('tokens_xml')
+
+
+    @property
+    def xml(self) -> str:
+        return self._part('xml')
+
+
+    def unlink(self):
+        # break the parse tree's parent/child cycles, if it was built, so it is freed
+        # without waiting for the garbage collector
+        parser_root = self._parts['parser_root']
+        if not callable(parser_root):
+            parser_root.unlink()
+
+
+    def __repr__(self):
+        return f'CompileResult(name={self.name!r}, tokens={len(self.tokens)})'
+
+
+def _class_name(tokens: list):
+    # the identifier following the first 'class' keyword
+    for index, token in enumerate(tokens[:-1]):
+        if token == 'class':
+            return tokens[index+1]
+    return None
+
+
+def _tokens_xml(tokenizer) -> str:
+    tokenizer.write_token_tags()
+    tokens_xml = tokenizer.to_xml()
+    # the token tags were only needed for the text
+    tokenizer.tokenizer_root.unlink()
+    return tokens_xml
+
+
+def _timed(timings, stage: str, function):
+    # function, adding the time of every call to timings[stage] when timings are collected
+    if timings is None:
+        return function
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+    return timed
+
+
+def _parse(tokenizer, compilation_engine):
+    compilation_engine.reset(tokenizer)
+    while tokenizer.has_more_tokens():
+        token, token_type = tokenizer.advance()
+
+        if token == 'class':
+            compilation_engine.compile_class(token, token_type)
+    return compilation_engine.parser_root
+
+
+def _compile(source, compilation_engine, name=None, lexer='python', timings=None) -> CompileResult:
+    # timings, when given, collects the seconds spent per stage: 'tokenize', 'parse', and
+    # 'tokens_xml' / 'parse_xml' once those are read
+    tokenizer = _timed(timings, 'tokenize', Tokenizer)(source=source, lexer=lexer)
+    parser_root = _timed(timings, 'parse', _parse)(tokenizer, compilation_engine)
+
+    # Serializing both xml files takes about as long as parsing, and only the analyzer's
+    # xml output needs them, so they are left until first asked for
+    return CompileResult(
+        name or _class_name(tokenizer.tokens), tokenizer.tokens, parser_root,
+        _timed(timings, 'tokens_xml', lambda: _tokens_xml(tokenizer)),
+        _timed(timings, 'parse_xml', lambda: format_xml(pretty_xml(parser_root)))
+    )
+
+
+class WorkerPool:
+    # Worker processes shared by the parallel compiles of many classes, only started when
+    # one is first needed. Compiles needing workers after shutdown start a pool of their own
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor = None
+        self.closed = False
+
+
+    def executor(self):
+        if self.closed:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        return self._executor
+
+
+    def shutdown(self):
+        self.closed = True
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+def _compile_parallel(source, compilation_engine, name, workers, pool, lexer='python'):
+    # Large classes are lexed and parsed a few subroutines per worker process. Nothing is
+    # compiled up front: the xml output is compiled by the workers when first read, a parse
+    # tree sequentially in this process. Tree consumers (--vm, --cost, --run, build) so
+    # never start the workers, and the xml output never waits on a sequential parse
+    jack = source.decode('utf-8') if isinstance(source, (bytes, bytearray)) else source
+    if len(jack) < PARALLEL_MIN_CHARS:
+        return _compile(jack, compilation_engine, name, lexer)
+
+    compiled = {}
+
+    def sequential() -> CompileResult:
+        if 'sequential' not in compiled:
+            compiled['sequential'] = _compile(jack, compilation_engine, name, lexer)
+        return compiled['sequential']
+
+    def parts() -> tuple:
+        # tokens, *T.xml and *.xml, compiled sequentially when the class can not be split
+        if 'parts' not in compiled:
+            executor = pool.executor() if pool is not None else None
+            compiled['parts'] = compile_parts(jack, workers, executor) or (
+                sequential().tokens, sequential().tokens_xml, sequential().xml
+            )
+        return compiled['parts']
+
+    def tokens() -> list:
+        # from whichever compile already ran, otherwise lexed on their own
+        if 'sequential' in compiled:
+            return compiled['sequential'].tokens
+        if 'parts' in compiled:
+            return compiled['parts'][0]
+        return Tokenizer(source=jack, lexer=lexer).tokens
+
+    return CompileResult(
+        name, tokens, lambda: sequential().parser_root, lambda: parts()[1], lambda: parts()[2]
+    )
+
+
+def compile_source(source, name=None, workers=None, lexer='python', timings=None) -> CompileResult:
+    # Compile Jack source given as text or bytes, without touching the filesystem.
+    # With workers > 1, a large class is split at its subroutines and compiled in parallel.
+    # lexer is one of tokenizer.LEXERS. timings collects per-stage seconds of a
+    # sequential compile (see _compile)
+    if workers is not None and workers > 1:
+        return _compile_parallel(source, CompilationEngine(None), name, workers, None, lexer)
+    return _compile(source, CompilationEngine(None), name, lexer, timings)
+
+
+def compile_many(sources, workers=None, lexer='python', compilation_engine=None, timings=None, pool=None):
+    # Lazily compile an iterable of sources, each either Jack text/bytes or a (name, source)
+    # pair, reusing a single compilation engine (and worker pool) across inputs. An engine
+    # or a WorkerPool can be passed in to reuse them across calls too, a passed pool is
+    # left running. The engine keeps the class tables of every class it parsed, for calls
+    # into them
+    if compilation_engine is None:
+        compilation_engine = CompilationEngine(None)
+    parallel = workers is not None and workers > 1
+    own_pool = pool is None and parallel
+    if own_pool:
+        pool = WorkerPool(workers)
+    try:
+        for source in sources:
+            if isinstance(source, tuple):
+                name, source = source
+            else:
+                name = None
+
+            if parallel:
+                yield _compile_parallel(source, compilation_engine, name, workers, pool, lexer)
+            else:
+                yield _compile(source, compilation_engine, name, lexer, timings)
+    finally:
+        if own_pool:
+            pool.shutdown()
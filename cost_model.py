@@ -0,0 +1,126 @@
+import json
+
+from code_generator import CodeGenerator
+
+OS_CLASSES = ['Math', 'String', 'Array', 'Output', 'Screen', 'Keyboard', 'Memory', 'Sys']
+
+# Rough VM instructions executed per call of common OS routines, for the cost estimate
+OS_CALL_COSTS = {
+    'Math.multiply': 250,
+    'Math.divide': 300,
+    'Math.sqrt': 600,
+    'Math.abs': 10,
+    'Math.min': 10,
+    'Math.max': 10,
+    'Memory.alloc': 60,
+    'Memory.deAlloc': 30,
+    'Memory.peek': 10,
+    'Memory.poke': 10,
+    'Array.new': 70,
+    'Array.dispose': 40,
+    'String.new': 90,
+    'String.appendChar': 25,
+    'String.charAt': 15,
+    'String.setCharAt': 15,
+    'String.length': 5,
+    'String.dispose': 40,
+    'Output.printChar': 400,
+    'Output.printString': 2000,
+    'Output.printInt': 2500,
+    'Output.println': 20,
+    'Screen.drawPixel': 400,
+    'Screen.drawLine': 5000,
+    'Screen.drawRectangle': 20000,
+    'Screen.drawCircle': 20000,
+    'Keyboard.keyPressed': 5,
+}
+DEFAULT_OS_CALL_COST = 100
+
+# Assumed iterations of each while loop when weighting instructions by nesting depth
+LOOP_ITERATIONS = 10
+
+SORT_KEYS = ['estimated_cost', 'instructions', 'calls', 'os_calls', 'array_accesses', 'loop_depth']
+
+
+class SubroutineCost:
+    def __init__(self, name: str, instructions: list):
+        self.name = name
+        self.instructions = len(instructions)
+        self.calls = 0
+        self.os_calls = {}
+        self.array_accesses = 0
+        self.loop_depth = 0
+        self.estimated_cost = 0
+
+        depth = 0
+        for instruction in instructions:
+            command = instruction[0]
+            weight = LOOP_ITERATIONS ** depth
+            self.estimated_cost += weight
+
+            if command == 'label' and instruction[1].startswith('WHILE_EXP'):
+                depth += 1
+                self.loop_depth = max(self.loop_depth, depth)
+            elif command == 'label' and instruction[1].startswith('WHILE_END'):
+                depth -= 1
+            elif command == 'call':
+                self.calls += 1
+                callee = instruction[1]
+                if callee.split('.')[0] in OS_CLASSES:
+                    self.os_calls[callee] = self.os_calls.get(callee, 0) + 1
+                    self.estimated_cost += weight * OS_CALL_COSTS.get(callee, DEFAULT_OS_CALL_COST)
+            elif command in ['push', 'pop'] and instruction[1] == 'that':
+                self.array_accesses += 1
+
+
+    def to_dict(self) -> dict:
+        return {
+            'subroutine': self.name,
+            'estimated_cost': self.estimated_cost,
+            'instructions': self.instructions,
+            'calls': self.calls,
+            'os_calls': sum(self.os_calls.values()),
+            'os_call_counts': dict(sorted(self.os_calls.items())),
+            'array_accesses': self.array_accesses,
+            'loop_depth': self.loop_depth,
+        }
+
+
+class CostModel:
+    # Static per-subroutine cost estimate from the generated VM code, no emulator needed
+    def __init__(self, results, string_pool=None):
+        self.costs = []
+        for result in results:
+            code_generator = CodeGenerator(result.parser_root, string_pool)
+            for name, instructions in code_generator.generate_subroutines():
+                self.costs.append(SubroutineCost(name, instructions))
+
+
+    def sorted_costs(self, sort_key: str = 'estimated_cost') -> list:
+        if sort_key not in SORT_KEYS:
+            raise ValueError(f'Cannot sort by {sort_key}, choose one of {", ".join(SORT_KEYS)}')
+        return sorted(
+            (cost.to_dict() for cost in self.costs),
+            key=lambda cost: (-cost[sort_key], cost['subroutine'])
+        )
+
+
+    def to_json(self, sort_key: str = 'estimated_cost') -> str:
+        return json.dumps(self.sorted_costs(sort_key), indent=2)
+
+
+    def to_table(self, sort_key: str = 'estimated_cost') -> str:
+        costs = self.sorted_costs(sort_key)
+        name_width = max([len('subroutine')] + [len(cost['subroutine']) for cost in costs]) + 2
+        lines = [
+            f'{"subroutine":<{name_width}}{"est. cost":>12}{"instrs":>9}{"calls":>8}'
+            f'{"OS calls":>10}{"arrays":>8}{"loops":>7}  top OS calls'
+        ]
+        for cost in costs:
+            top_os_calls = sorted(cost['os_call_counts'].items(), key=lambda item: -item[1])[:3]
+            lines.append(
+                f'{cost["subroutine"]:<{name_width}}{cost["estimated_cost"]:>12,}{cost["instructions"]:>9}'
+                f'{cost["calls"]:>8}{cost["os_calls"]:>10}{cost["array_accesses"]:>8}{cost["loop_depth"]:>7}  '
+                + ', '.join(f'{callee} x{count}' for callee, count in top_os_calls)
+            )
+        return '\n'.join(lines)
@@ -0,0 +1,78 @@
+RAM_SIZE = 32768
+WORD_MASK = 0xFFFF
+
+
+def signed(word: int) -> int:
+    # 16-bit two's complement value of a RAM word
+    return word - 0x10000 if word & 0x8000 else word
+
+
+class HackCPU:
+    # Runs a Hack binary (lines of 16 '0'/'1' characters, as the assembler writes them),
+    # to check the VM translator and assembler end to end. The ALU follows its control
+    # bits (zx, nx, zy, ny, f, no) rather than a table of mnemonics
+    def __init__(self, binary: list):
+        self.rom = [int(line, 2) for line in binary]
+        self.ram = [0] * RAM_SIZE
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+
+
+    def _alu(self, x: int, y: int, control: int) -> int:
+        if control & 0b100000:
+            x = 0
+        if control & 0b010000:
+            x = ~x
+        if control & 0b001000:
+            y = 0
+        if control & 0b000100:
+            y = ~y
+        out = x + y if control & 0b000010 else x & y
+        if control & 0b000001:
+            out = ~out
+        return out & WORD_MASK
+
+
+    def _halted(self, target: int) -> bool:
+        # the usual end of a Hack program, '(END) @END 0;JMP', jumps back to the A-instruction
+        # right before it
+        return target == self.pc - 1 and self.rom[target] == target
+
+
+    def run(self, max_steps: int = 10_000_000) -> int:
+        # Executes until the program halts, returning the number of instructions run
+        rom, ram = self.rom, self.ram
+        for step in range(max_steps):
+            if self.pc >= len(rom):
+                return step
+            instruction = rom[self.pc]
+            if not instruction & 0x8000:
+                self.a = instruction
+                self.pc += 1
+                continue
+
+            y = ram[self.a] if instruction & 0x1000 else self.a
+            out = self._alu(self.d, y, (instruction >> 6) & 0b111111)
+            address = self.a
+            if instruction & 0b100000:
+                self.a = out
+            if instruction & 0b010000:
+                self.d = out
+            if instruction & 0b001000:
+                ram[address] = out
+
+            value = signed(out)
+            jump = instruction & 0b111
+            if (
+                (jump & 0b100 and value < 0) or (jump & 0b010 and value == 0)
+                or (jump & 0b001 and value > 0)
+            ):
+                # the jump goes to A as it was before this instruction
+                if self._halted(address):
+                    return step + 1
+                self.pc = address
+            else:
+                self.pc += 1
+
+        raise RuntimeError(f'Hack program did not halt within {max_steps:,} instructions')
@@ -0,0 +1,614 @@
+import sys
+
+from compilation_engine import children, text
+from symbol_table import SYMBOL_KEY, SCOPE_KEY, CALL_KEY
+
+RAM_SIZE = 32768
+HEAP_BASE = 2048
+HEAP_END = 16384
+SCREEN_BASE = 16384
+KEYBOARD = 24576
+
+# Hack character set codes the OS gives special meaning
+NEW_LINE = 128
+BACKSPACE = 129
+DOUBLE_QUOTE = 34
+
+# Python frames per Jack call are several, so deep Jack recursion needs headroom
+RECURSION_LIMIT = 20000
+
+
+class JackError(Exception):
+    # Sys.error, or a runtime failure the VM would report through it
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class Halt(Exception):
+    # Sys.halt
+    pass
+
+
+def wrap(value: int) -> int:
+    # 16-bit two's complement
+    return ((value + 32768) & 0xFFFF) - 32768
+
+
+def _divide(x: int, y: int) -> int:
+    if y == 0:
+        raise JackError('Division by zero', 3)
+    quotient = abs(x) // abs(y)
+    return wrap(quotient if (x < 0) == (y < 0) else -quotient)
+
+
+BINARY_OPS = {
+    '+': lambda x, y: wrap(x + y),
+    '-': lambda x, y: wrap(x - y),
+    '*': lambda x, y: wrap(x * y),
+    '/': _divide,
+    '&': lambda x, y: x & y,
+    '|': lambda x, y: x | y,
+    '<': lambda x, y: -1 if x < y else 0,
+    '>': lambda x, y: -1 if x > y else 0,
+    '=': lambda x, y: -1 if x == y else 0,
+}
+UNARY_OPS = {
+    '-': lambda x: wrap(-x),
+    '~': lambda x: ~x,
+}
+
+
+class JackOS:
+    # Stub of the Jack OS over a flat RAM list. Output goes to an in-memory text buffer,
+    # Screen calls only touch the screen memory map, Keyboard reads scripted input
+    def __init__(self, ram: list, keys=None, lines=None):
+        self.ram = ram
+        self.output = []
+        # scripted keyboard: keyPressed/readChar take from keys, readLine/readInt from lines
+        self.keys = list(keys or [])
+        self.lines = list(lines or [])
+        self.color = True
+        self.heap_top = HEAP_BASE
+        self.free_blocks = {}
+
+
+    def functions(self) -> dict:
+        return {
+            'Math.init': lambda: 0,
+            'Math.abs': lambda x: wrap(abs(x)),
+            'Math.multiply': BINARY_OPS['*'],
+            'Math.divide': _divide,
+            'Math.min': min,
+            'Math.max': max,
+            'Math.sqrt': self.sqrt,
+            'Memory.init': lambda: 0,
+            'Memory.peek': lambda address: self.ram[address],
+            'Memory.poke': self.poke,
+            'Memory.alloc': self.alloc,
+            'Memory.deAlloc': self.de_alloc,
+            'Array.new': self.array_new,
+            'Array.dispose': self.de_alloc,
+            'String.new': self.string_new,
+            'String.dispose': self.string_dispose,
+            'String.length': lambda string: self.ram[string + 1],
+            'String.charAt': self.char_at,
+            'String.setCharAt': self.set_char_at,
+            'String.appendChar': self.append_char,
+            'String.eraseLastChar': self.erase_last_char,
+            'String.intValue': self.int_value,
+            'String.setInt': self.set_int,
+            'String.backSpace': lambda: BACKSPACE,
+            'String.doubleQuote': lambda: DOUBLE_QUOTE,
+            'String.newLine': lambda: NEW_LINE,
+            'Output.init': lambda: 0,
+            'Output.moveCursor': lambda i, j: 0,
+            'Output.printChar': self.print_char,
+            'Output.printString': self.print_string,
+            'Output.printInt': self.print_int,
+            'Output.println': lambda: self.print_char(NEW_LINE),
+            'Output.backSpace': lambda: self.print_char(BACKSPACE),
+            'Screen.init': lambda: 0,
+            'Screen.clearScreen': self.clear_screen,
+            'Screen.setColor': self.set_color,
+            'Screen.drawPixel': lambda x, y: 0,
+            'Screen.drawLine': lambda x1, y1, x2, y2: 0,
+            'Screen.drawRectangle': lambda x1, y1, x2, y2: 0,
+            'Screen.drawCircle': lambda x, y, r: 0,
+            'Keyboard.init': lambda: 0,
+            'Keyboard.keyPressed': self.key_pressed,
+            'Keyboard.readChar': self.read_char,
+            'Keyboard.readLine': self.read_line,
+            'Keyboard.readInt': self.read_int,
+            'Sys.init': lambda: 0,
+            'Sys.halt': self.halt,
+            'Sys.error': self.error,
+            'Sys.wait': lambda duration: 0,
+        }
+
+
+    def sqrt(self, x: int) -> int:
+        if x < 0:
+            raise JackError('Cannot compute square root of a negative number', 4)
+        return int(x ** 0.5)
+
+
+    def poke(self, address: int, value: int) -> int:
+        self.ram[address] = value
+        return 0
+
+
+    def alloc(self, size: int) -> int:
+        if size <= 0:
+            raise JackError('Allocated memory size must be positive', 5)
+        # exact-size reuse of freed blocks, otherwise bump the heap; the size is kept
+        # in the word before the block like the OS does
+        blocks = self.free_blocks.get(size)
+        if blocks:
+            return blocks.pop()
+        if self.heap_top + size + 1 > HEAP_END:
+            raise JackError('Heap overflow', 6)
+        block = self.heap_top + 1
+        self.ram[self.heap_top] = size
+        self.heap_top += size + 1
+        return block
+
+
+    def de_alloc(self, block: int) -> int:
+        self.free_blocks.setdefault(self.ram[block - 1], []).append(block)
+        return 0
+
+
+    def array_new(self, size: int) -> int:
+        if size <= 0:
+            raise JackError('Array size must be positive', 2)
+        return self.alloc(size)
+
+
+    # Strings are 3-word objects: character buffer, length, maximum length
+    def string_new(self, max_length: int) -> int:
+        if max_length < 0:
+            raise JackError('Maximum length must be non-negative', 14)
+        string = self.alloc(3)
+        self.ram[string] = self.alloc(max_length) if max_length > 0 else 0
+        self.ram[string + 1] = 0
+        self.ram[string + 2] = max_length
+        return string
+
+
+    def string_dispose(self, string: int) -> int:
+        if self.ram[string]:
+            self.de_alloc(self.ram[string])
+        return self.de_alloc(string)
+
+
+    def char_at(self, string: int, index: int) -> int:
+        if not 0 <= index < self.ram[string + 1]:
+            raise JackError('String index out of bounds', 15)
+        return self.ram[self.ram[string] + index]
+
+
+    def set_char_at(self, string: int, index: int, char: int) -> int:
+        if not 0 <= index < self.ram[string + 1]:
+            raise JackError('String index out of bounds', 16)
+        self.ram[self.ram[string] + index] = char
+        return 0
+
+
+    def append_char(self, string: int, char: int) -> int:
+        length = self.ram[string + 1]
+        if length >= self.ram[string + 2]:
+            raise JackError('String is full', 17)
+        self.ram[self.ram[string] + length] = char
+        self.ram[string + 1] = length + 1
+        return string
+
+
+    def erase_last_char(self, string: int) -> int:
+        if self.ram[string + 1] == 0:
+            raise JackError('String is empty', 18)
+        self.ram[string + 1] -= 1
+        return 0
+
+
+    def to_python(self, string: int) -> str:
+        buffer = self.ram[string]
+        return ''.join(chr(self.ram[buffer + i]) for i in range(self.ram[string + 1]))
+
+
+    def int_value(self, string: int) -> int:
+        chars = self.to_python(string)
+        digits = chars[1:] if chars.startswith('-') else chars
+        value = 0
+        for char in digits:
+            if not char.isdigit():
+                break
+            value = value * 10 + int(char)
+        return wrap(-value if chars.startswith('-') else value)
+
+
+    def set_int(self, string: int, value: int) -> int:
+        digits = str(value)
+        if len(digits) > self.ram[string + 2]:
+            raise JackError('String is too short for the number', 19)
+        self.ram[string + 1] = 0
+        for char in digits:
+            self.append_char(string, ord(char))
+        return 0
+
+
+    def print_char(self, char: int) -> int:
+        if char == NEW_LINE:
+            self.output.append('\n')
+        elif char == BACKSPACE:
+            if self.output and self.output[-1] != '\n':
+                self.output.pop()
+        else:
+            self.output.append(chr(char))
+        return 0
+
+
+    def print_string(self, string: int) -> int:
+        # one char at a time, so newLine and backSpace chars in the string take effect
+        buffer = self.ram[string]
+        for i in range(self.ram[string + 1]):
+            self.print_char(self.ram[buffer + i])
+        return 0
+
+
+    def print_int(self, value: int) -> int:
+        # output holds single chars, so a backSpace only ever removes one
+        self.output.extend(str(value))
+        return 0
+
+
+    def clear_screen(self) -> int:
+        self.ram[SCREEN_BASE:KEYBOARD] = [0] * (KEYBOARD - SCREEN_BASE)
+        return 0
+
+
+    def set_color(self, color: int) -> int:
+        self.color = color != 0
+        return 0
+
+
+    def key_pressed(self) -> int:
+        return self.keys.pop(0) if self.keys else 0
+
+
+    def read_char(self) -> int:
+        if not self.keys:
+            raise JackError('Keyboard input exhausted')
+        char = self.keys.pop(0)
+        self.print_char(char)
+        return char
+
+
+    def read_line(self, message: int) -> int:
+        self.print_string(message)
+        if not self.lines:
+            raise JackError('Keyboard input exhausted')
+        line = self.lines.pop(0)
+        self.output.extend(line + '\n')
+        string = self.string_new(max(len(line), 1))
+        for char in line:
+            self.append_char(string, ord(char))
+        return string
+
+
+    def read_int(self, message: int) -> int:
+        string = self.read_line(message)
+        value = self.int_value(string)
+        self.string_dispose(string)
+        return value
+
+
+    def halt(self) -> int:
+        raise Halt()
+
+
+    def error(self, code: int) -> int:
+        raise JackError(f'Sys.error({code})', code)
+
+
+class Executor:
+    # Runs Jack programs straight from CompilationEngine parse trees. Every subroutine
+    # is compiled once into nested Python closures over a frame list (slot 0 holds
+    # `this`, then arguments, then locals), so no VM code is generated or emulated.
+    # Variables are bound through the slots the compilation engine recorded.
+    # With profile=True every executed statement and subroutine call is counted.
+    def __init__(self, parser_roots, keys=None, lines=None, profile=False):
+        self.ram = [0] * RAM_SIZE
+        self.os = JackOS(self.ram, keys, lines)
+        self.functions = self.os.functions()
+        self.profile = profile
+        self.statement_count = 0
+        self.call_counts = {}
+
+        for parser_root in parser_roots:
+            self._compile_class(parser_root)
+
+
+    @property
+    def output(self) -> str:
+        return ''.join(self.os.output)
+
+
+    def run(self, entry: str = 'Main.main') -> int:
+        if entry not in self.functions:
+            raise JackError(f'Unknown subroutine {entry}')
+
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(recursion_limit, RECURSION_LIMIT))
+        try:
+            return self.functions[entry]()
+        except Halt:
+            return 0
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+
+
+    def report(self) -> str:
+        lines = [f'{self.statement_count:,} statements executed']
+        for name, count in sorted(self.call_counts.items(), key=lambda item: -item[1]):
+            if count == 0:
+                continue
+            lines.append(f'{count:>12,}  {name}')
+        return '\n'.join(lines)
+
+
+    def _compile_class(self, class_tag):
+        if class_tag.nodeType == class_tag.DOCUMENT_NODE:
+            class_tag = class_tag.documentElement
+        self.class_name = text(children(class_tag)[1])
+        class_table = class_tag.getUserData(SCOPE_KEY)
+        self.statics = [0] * class_table.var_count('static')
+        self.n_fields = class_table.var_count('field')
+
+        for tag in children(class_tag):
+            if tag.tagName == 'subroutineDec':
+                self._compile_subroutine(tag)
+
+
+    def _compile_subroutine(self, subroutine_tag):
+        tags = children(subroutine_tag)
+        kind, name = text(tags[0]), text(tags[2])
+        body_tags = children(tags[6])
+
+        counts = subroutine_tag.getUserData(SCOPE_KEY)
+        n_args = self.n_args = counts['arg']
+        frame_size = 1 + n_args + counts['var']
+        statements_tag = [tag for tag in body_tags if tag.tagName == 'statements'][0]
+        body = self._compile_statements(statements_tag)
+
+        full_name = f'{self.class_name}.{name}'
+        alloc, n_fields = self.os.alloc, self.n_fields
+
+        def call(*args):
+            if len(args) != n_args:
+                # a slice assignment would silently resize the frame and shift the locals
+                raise JackError(f'{full_name} expects {n_args} arguments, got {len(args)}')
+            frame = [0] * frame_size
+            frame[1:1 + n_args] = args
+            if kind == 'method':
+                frame[0] = args[0]
+            elif kind == 'constructor':
+                frame[0] = alloc(n_fields) if n_fields else alloc(1)
+            result = body(frame)
+            return 0 if result is None else result
+
+        if self.profile:
+            call_counts, counted_call = self.call_counts, call
+            call_counts[full_name] = 0
+
+            def call(*args):
+                call_counts[full_name] += 1
+                return counted_call(*args)
+
+        self.functions[full_name] = call
+
+
+    def _slot(self, name_tag) -> tuple:
+        symbol = name_tag.getUserData(SYMBOL_KEY)
+        if symbol is None:
+            raise JackError(f'Undefined variable {text(name_tag)} in class {self.class_name}')
+        _, kind, index = symbol
+        if kind == 'arg':
+            index += 1
+        elif kind == 'var':
+            index += 1 + self.n_args
+        return kind, index
+
+
+    def _getter(self, name_tag):
+        kind, index = self._slot(name_tag)
+        if kind == 'static':
+            statics = self.statics
+            return lambda frame: statics[index]
+        elif kind == 'field':
+            ram = self.ram
+            return lambda frame: ram[frame[0] + index]
+        return lambda frame: frame[index]
+
+
+    def _setter(self, name_tag):
+        kind, index = self._slot(name_tag)
+        if kind == 'static':
+            statics = self.statics
+
+            def set_static(frame, value):
+                statics[index] = value
+            return set_static
+        elif kind == 'field':
+            ram = self.ram
+
+            def set_field(frame, value):
+                ram[frame[0] + index] = value
+            return set_field
+
+        def set_frame(frame, value):
+            frame[index] = value
+        return set_frame
+
+
+    def _compile_statements(self, statements_tag):
+        statements = tuple(self._compile_statement(tag) for tag in children(statements_tag))
+
+        if self.profile:
+            executor = self
+
+            def block(frame):
+                for statement in statements:
+                    executor.statement_count += 1
+                    result = statement(frame)
+                    if result is not None:
+                        return result
+            return block
+
+        def block(frame):
+            for statement in statements:
+                result = statement(frame)
+                if result is not None:
+                    return result
+        return block
+
+
+    def _compile_statement(self, statement_tag):
+        # statements return None to fall through, or the subroutine's return value
+        statement = statement_tag.tagName
+        tags = children(statement_tag)
+
+        if statement == 'letStatement':
+            if text(tags[2]) == '[':
+                array, index, value = self._getter(tags[1]), self._compile_expression(tags[3]), self._compile_expression(tags[6])
+                ram = self.ram
+
+                def let_array(frame):
+                    address = array(frame) + index(frame)
+                    ram[address] = value(frame)
+                return let_array
+
+            setter, value = self._setter(tags[1]), self._compile_expression(tags[3])
+
+            def let(frame):
+                setter(frame, value(frame))
+            return let
+
+        elif statement == 'doStatement':
+            call = self._compile_subroutine_call(tags[1:-1])
+
+            def do(frame):
+                call(frame)
+            return do
+
+        elif statement == 'whileStatement':
+            condition, body = self._compile_expression(tags[2]), self._compile_statements(tags[5])
+
+            def while_loop(frame):
+                while condition(frame):
+                    result = body(frame)
+                    if result is not None:
+                        return result
+            return while_loop
+
+        elif statement == 'ifStatement':
+            condition, if_body = self._compile_expression(tags[2]), self._compile_statements(tags[5])
+            else_body = self._compile_statements(tags[9]) if len(tags) > 7 else None
+
+            def if_else(frame):
+                if condition(frame):
+                    return if_body(frame)
+                elif else_body is not None:
+                    return else_body(frame)
+            return if_else
+
+        elif statement == 'returnStatement':
+            if tags[1].tagName == 'expression':
+                value = self._compile_expression(tags[1])
+                return value
+            return lambda frame: 0
+
+        raise ValueError(f'Unknown statement: {statement}')
+
+
+    def _compile_expression(self, expression_tag):
+        # term (op term)*, evaluated left to right without precedence
+        tags = children(expression_tag)
+        expression = self._compile_term(tags[0])
+        for op_tag, term_tag in zip(tags[1::2], tags[2::2]):
+            expression = self._combine(BINARY_OPS[text(op_tag)], expression, self._compile_term(term_tag))
+        return expression
+
+
+    def _combine(self, op, left, right):
+        return lambda frame: op(left(frame), right(frame))
+
+
+    def _compile_term(self, term_tag):
+        tags = children(term_tag)
+        first = tags[0]
+        token_type, token = first.tagName, text(first)
+
+        if token_type == 'integerConstant':
+            value = int(token)
+            return lambda frame: value
+        elif token_type == 'stringConstant':
+            string_new, append_char = self.os.string_new, self.os.append_char
+            chars = [ord(char) for char in token]
+
+            def string_constant(frame):
+                string = string_new(len(chars))
+                for char in chars:
+                    append_char(string, char)
+                return string
+            return string_constant
+        elif token_type == 'keyword':
+            if token == 'true':
+                return lambda frame: -1
+            elif token == 'this':
+                return lambda frame: frame[0]
+            return lambda frame: 0
+        elif token_type == 'symbol' and token == '(':
+            return self._compile_expression(tags[1])
+        elif token_type == 'symbol':
+            op, term = UNARY_OPS[token], self._compile_term(tags[1])
+            return lambda frame: op(term(frame))
+        elif len(tags) == 1:
+            return self._getter(first)
+        elif text(tags[1]) == '[':
+            array, index, ram = self._getter(first), self._compile_expression(tags[2]), self.ram
+            return lambda frame: ram[array(frame) + index(frame)]
+        return self._compile_subroutine_call(tags)
+
+
+    def _compile_subroutine_call(self, tags: list):
+        # subroutineName '(' expressionList ')' or
+        # (className | varName) '.' subroutineName '(' expressionList ')'
+        expression_list_tag = [tag for tag in tags if tag.tagName == 'expressionList'][0]
+        args = [
+            self._compile_expression(tag) for tag in children(expression_list_tag)
+            if tag.tagName == 'expression'
+        ]
+
+        if text(tags[1]) == '.':
+            full_name, kind = tags[2].getUserData(CALL_KEY)
+            if tags[0].getUserData(SYMBOL_KEY) is not None:
+                # method call on an object
+                args.insert(0, self._getter(tags[0]))
+            elif kind == 'method':
+                raise JackError(f'{full_name} is a method and needs an object, not its class name')
+        else:
+            full_name, kind = tags[0].getUserData(CALL_KEY)
+            if kind not in ['function', 'constructor']:
+                # method call on this
+                args.insert(0, lambda frame: frame[0])
+
+        # looked up at call time so subroutines of later classes resolve too
+        functions = self.functions
+
+        def call(frame):
+            function = functions.get(full_name)
+            if function is None:
+                raise JackError(f'Unknown subroutine {full_name}')
+            return function(*[arg(frame) for arg in args])
+        return call
@@ -0,0 +1,165 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from tokenizer import Tokenizer, SYMBOLS
+from compilation_engine import CompilationEngine, pretty_xml, format_xml
+
+# Smaller sources are compiled sequentially, the process pool would only add overhead
+PARALLEL_MIN_CHARS = 64 * 1024
+# Subroutine chunks handed to each worker, so uneven subroutines still balance out
+CHUNKS_PER_WORKER = 4
+
+SUBROUTINE_START = re.compile(r'(constructor|function|method)\s')
+CODE_MARKER = re.compile(r'/\*|"|[{}]')
+# Closes the class after a chunk of subroutines so it parses on its own
+CHUNK_SENTINEL = '\n}'
+
+
+def split_points(jack: str) -> list:
+    # Offsets of lines starting a top-level constructor/function/method declaration.
+    # Comments and strings are tracked the way Tokenizer strips them (line comments
+    # first, then block comments regardless of strings, then strings), so a chunk
+    # boundary never falls inside either one and each chunk lexes to the same tokens.
+    points = []
+    offset = 0
+    depth = 0
+    in_comment = False
+    in_string = False
+    last_code_char = None
+
+    for line in jack.splitlines(keepends=True):
+        stripped = line.strip()
+        if (
+            depth == 1 and not in_comment and not in_string
+            and (last_code_char is None or last_code_char in SYMBOLS or last_code_char == '"')
+            and SUBROUTINE_START.match(stripped + ' ')
+        ):
+            points.append(offset)
+        offset += len(line)
+
+        if stripped.startswith('//'):
+            continue
+        code = line.split('//')[0]
+
+        position = 0
+        while position < len(code):
+            if in_comment:
+                end = code.find('*/', position)
+                if end == -1:
+                    break
+                in_comment = False
+                position = end + 2
+                continue
+
+            match = CODE_MARKER.search(code, position)
+            visible = code[position:match.start() if match else len(code)].strip()
+            if visible:
+                last_code_char = visible[-1]
+            if match is None:
+                break
+
+            found = match.group()
+            position = match.end()
+            if found == '/*':
+                in_comment = True
+                continue
+            if found == '"':
+                in_string = not in_string
+            elif not in_string:
+                depth += 1 if found == '{' else -1
+            last_code_char = found
+
+    return points
+
+
+def split_source(jack: str, n_chunks: int) -> list:
+    # Header (up to the first subroutine) followed by up to n_chunks runs of whole subroutines
+    points = split_points(jack)
+    if not points:
+        return [jack]
+
+    n_chunks = max(1, min(n_chunks, len(points)))
+    group_starts = [points[len(points) * i // n_chunks] for i in range(n_chunks)]
+    bounds = [0] + group_starts + [len(jack)]
+    return [jack[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _xml_lines(tokenizer, parser_root) -> tuple:
+    # *T.xml token tag lines and pretty_xml lines of the class's children, each without
+    # the enclosing <tokens> / <class> tags. Pretty printing a tree is mostly a walk over
+    # its children, so the lines of consecutive pieces join up to those of the whole class
+    tokenizer.write_token_tags()
+    token_lines = tokenizer.to_xml().splitlines()[1:-1]
+    tree_lines = pretty_xml(parser_root).splitlines()[1:-1]
+    # both trees are garbage now, freed right away instead of by the garbage collector
+    tokenizer.tokenizer_root.unlink()
+    parser_root.unlink()
+    return token_lines, tree_lines
+
+
+def _compile_chunk(args):
+    # Tokens, *T.xml lines and unformatted *.xml lines of a chunk of subroutines. Workers
+    # send back text rather than trees, which would have to be rebuilt one node at a time
+    chunk, is_last = args
+    tokenizer = Tokenizer(source=chunk if is_last else chunk + CHUNK_SENTINEL)
+    compilation_engine = CompilationEngine(tokenizer)
+
+    # subroutineDecs parse into a stand-in class tag, up to the class closing '}'
+    class_tag = compilation_engine.parser_root.createElement('class')
+    compilation_engine.parser_root.appendChild(class_tag)
+    token, token_type = tokenizer.advance()
+    while token != '}':
+        token, token_type = compilation_engine.compile_subroutine(class_tag, token, token_type)
+    compilation_engine._create_tag(class_tag, token_type, token)
+
+    token_lines, tree_lines = _xml_lines(tokenizer, compilation_engine.parser_root)
+    if is_last:
+        return tokenizer.tokens, '\n'.join(token_lines), '\n'.join(tree_lines)
+    # an inner chunk's sentinel '}' is one token, one token tag line and one tree line
+    return tokenizer.tokens[:-1], '\n'.join(token_lines[:-1]), '\n'.join(tree_lines[:-1])
+
+
+def _compile_header(header: str) -> tuple:
+    tokenizer = Tokenizer(source=header + CHUNK_SENTINEL)
+    compilation_engine = CompilationEngine(tokenizer)
+    while tokenizer.has_more_tokens():
+        token, token_type = tokenizer.advance()
+        if token == 'class':
+            compilation_engine.compile_class(token, token_type)
+
+    # drop the sentinel '}', the last chunk brings the real one
+    token_lines, tree_lines = _xml_lines(tokenizer, compilation_engine.parser_root)
+    return tokenizer.tokens[:-1], token_lines[:-1], ['<class>'] + tree_lines[:-1]
+
+
+def compile_parts(jack: str, workers: int = None, executor=None):
+    # Lex one class split at its subroutines, returning the same token list, *T.xml and
+    # *.xml contents as a sequential run, or None when the source can not be split
+    workers = workers or os.cpu_count() or 1
+    chunks = split_source(jack, workers * CHUNKS_PER_WORKER)
+    if len(chunks) < 3:
+        return None
+
+    header, chunks = chunks[0], chunks[1:]
+    chunk_args = [(chunk, index == len(chunks) - 1) for index, chunk in enumerate(chunks)]
+    if executor is None:
+        with ProcessPoolExecutor(workers) as executor:
+            return _stitch(header, executor.map(_compile_chunk, chunk_args))
+    return _stitch(header, executor.map(_compile_chunk, chunk_args))
+
+
+def _stitch(header: str, chunk_results) -> tuple:
+    # the header parses while the workers handle the subroutines. All that is left to
+    # do here is joining text, so the serial part stays small
+    tokens, token_lines, tree_lines = _compile_header(header)
+    token_parts = ['<tokens>'] + token_lines
+    tree_parts = tree_lines
+    for chunk_tokens, chunk_token_xml, chunk_tree_xml in chunk_results:
+        tokens.extend(chunk_tokens)
+        token_parts.append(chunk_token_xml)
+        tree_parts.append(chunk_tree_xml)
+    token_parts.append('</tokens>')
+    tree_parts.append('</class>')
+
+    return tokens, '\n'.join(token_parts), format_xml('\n'.join(tree_parts))
@@ -0,0 +1,97 @@
+import os
+import time
+
+from code_generator import generate_program
+from vm_translator import VMTranslator, parse_vm
+from assembler import Assembler
+
+STAGES = ['read', 'parse', 'codegen', 'translate', 'assemble', 'write']
+
+# Stand-in for the OS Sys.init when no OS is linked: run Main.main, then halt
+SYS_INIT = [
+    ('function', 'Sys.init', 0),
+    ('call', 'Main.main', 0),
+    ('pop', 'temp', 0),
+    ('label', 'HALT'),
+    ('goto', 'HALT'),
+]
+
+
+def read_os_dir(os_dir: str) -> dict:
+    # OS classes as compiled .vm files, keyed by class name
+    os_program = {}
+    for vm_file in sorted(os.listdir(os_dir)):
+        if vm_file.endswith('.vm'):
+            with open(os.path.join(os_dir, vm_file)) as f:
+                os_program[vm_file[:-3]] = parse_vm(f.read())
+    return os_program
+
+
+class Pipeline:
+    # Jack parse trees -> VM commands -> Hack assembly -> Hack binary, entirely in memory.
+    # Each stage hands its instruction list straight to the next and is timed separately
+    def __init__(self, bootstrap=True, os_program=None, string_pool=None):
+        self.bootstrap = bootstrap
+        self.os_program = os_program or {}
+        self.string_pool = string_pool
+        self.timings = {stage: 0.0 for stage in STAGES}
+        self.program = {}
+        self.asm = []
+        self.binary = []
+        # assembler symbols, labels and variables (statics are Class.index) with their addresses
+        self.symbols = {}
+
+
+    def _timed(self, stage: str, start: float):
+        self.timings[stage] += time.perf_counter() - start
+
+
+    def run(self, parser_roots) -> list:
+        start = time.perf_counter()
+        self.program = dict(self.os_program)
+        self.program.update(generate_program(parser_roots, self.string_pool))
+        defined = {i[1] for instructions in self.program.values() for i in instructions if i[0] == 'function'}
+        if self.bootstrap and 'Sys.init' not in defined:
+            self.program['Sys'] = SYS_INIT
+            defined.add('Sys.init')
+        self._timed('codegen', start)
+
+        unresolved = sorted({
+            i[1] for instructions in self.program.values() for i in instructions
+            if i[0] == 'call' and i[1] not in defined
+        })
+        if unresolved:
+            raise ValueError(
+                'Unresolved subroutine calls: ' + ', '.join(unresolved)
+                + '. Link the Jack OS .vm files with --os-dir.'
+            )
+
+        start = time.perf_counter()
+        vm_translator = VMTranslator()
+        if self.bootstrap:
+            vm_translator.bootstrap()
+        for class_name, instructions in self.program.items():
+            vm_translator.translate(class_name, instructions)
+        self.asm = vm_translator.asm
+        self._timed('translate', start)
+
+        start = time.perf_counter()
+        assembler = Assembler()
+        self.binary = assembler.assemble(self.asm)
+        self.symbols = assembler.symbols
+        self._timed('assemble', start)
+
+        return self.binary
+
+
+    def report(self) -> str:
+        total = sum(self.timings.values())
+        lines = [
+            f'{len(self.program)} classes, {sum(len(i) for i in self.program.values()):,} VM commands, '
+            f'{len(self.asm):,} asm lines, {len(self.binary):,} instructions'
+        ]
+        for stage in STAGES:
+            share = self.timings[stage] / total if total else 0.0
+            lines.append(f'{stage:<12}{self.timings[stage] * 1000:>10.2f} ms{share:>8.1%}')
+        lines.append(f'{"total":<12}{total * 1000:>10.2f} ms')
+        return '\n'.join(lines)
@@ -0,0 +1,142 @@
+import os
+import io
+import time
+import tarfile
+import zipfile
+
+TAR_EXTENSIONS = ['.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz']
+ZIP_EXTENSIONS = ['.zip']
+TAR_WRITE_MODES = {
+    '.tar': 'w',
+    '.tar.gz': 'w:gz',
+    '.tgz': 'w:gz',
+    '.tar.bz2': 'w:bz2',
+    '.tbz2': 'w:bz2',
+    '.tar.xz': 'w:xz',
+    '.txz': 'w:xz',
+}
+
+
+def is_archive(path: str) -> bool:
+    return is_tar(path) or is_zip(path)
+
+
+def is_tar(path: str) -> bool:
+    return any(path.endswith(extension) for extension in TAR_EXTENSIONS)
+
+
+def is_zip(path: str) -> bool:
+    return any(path.endswith(extension) for extension in ZIP_EXTENSIONS)
+
+
+def scan_dir(root: str, recursive: bool = False) -> list:
+    # .jack file paths under root in a stable order, descending into subdirectories
+    # (but not the analyzer's own target directories) when recursive
+    return [entry.path for entry in scan_entries(root, recursive)]
+
+
+def scan_entries(root: str, recursive: bool = False):
+    # os.DirEntry of every .jack file scan_dir finds, in the same order. File types come
+    # from the directory listing itself, so only entry.stat() costs a system call
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        subdirectories = []
+        with os.scandir(directory) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                if entry.is_file() and entry.name.endswith('.jack'):
+                    yield entry
+                elif recursive and entry.is_dir() and entry.name != 'target':
+                    subdirectories.append(entry.path)
+        # depth first, in name order
+        directories.extend(reversed(subdirectories))
+
+
+def member_path(path: str, name: str) -> str:
+    # Archive member name as a normalized relative path. Output names are derived from it,
+    # so absolute names and '..' components, which would write outside the output tree
+    # or archive, are rejected
+    parts = name.replace('\\', '/').split('/')
+    if name.startswith(('/', '\\')) or ':' in parts[0] or '..' in parts:
+        raise ValueError(f'Unsafe member name {name!r} in {path}')
+    return '/'.join(part for part in parts if part not in ['', '.'])
+
+
+def read_archive(path: str):
+    # Lazily yield (member path, Jack source) for every .jack member, one member in memory at a time
+    if is_zip(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and member.filename.endswith('.jack'):
+                    name = member_path(path, member.filename)
+                    with archive.open(member) as f:
+                        yield name, f.read().decode('utf-8')
+    else:
+        # streaming mode, so compressed tars are never seeked or read twice
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith('.jack'):
+                    name = member_path(path, member.name)
+                    yield name, archive.extractfile(member).read().decode('utf-8')
+
+
+class TreeSink:
+    # Writes outputs under a root directory, mirroring the input's relative paths
+    def __init__(self, root: str):
+        self.root = root
+
+
+    def write(self, name: str, text: str) -> str:
+        output_file = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        with open(output_file, 'w') as f:
+            f.write(text)
+        return output_file
+
+
+    def close(self):
+        pass
+
+
+class TarSink:
+    def __init__(self, path: str):
+        mode = next(mode for extension, mode in TAR_WRITE_MODES.items() if path.endswith(extension))
+        self.archive = tarfile.open(path, mode)
+
+
+    def write(self, name: str, text: str) -> str:
+        data = text.encode('utf-8')
+        member = tarfile.TarInfo(name)
+        member.size = len(data)
+        member.mtime = int(time.time())
+        self.archive.addfile(member, io.BytesIO(data))
+        return name
+
+
+    def close(self):
+        self.archive.close()
+
+
+class ZipSink:
+    def __init__(self, path: str):
+        self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+
+
+    def write(self, name: str, text: str) -> str:
+        self.archive.writestr(name, text)
+        return name
+
+
+    def close(self):
+        self.archive.close()
+
+
+def open_sink(path: str):
+    # an archive of the type its extension names, otherwise a directory tree
+    if is_archive(path) and os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if is_zip(path):
+        return ZipSink(path)
+    elif is_tar(path):
+        return TarSink(path)
+    return TreeSink(path)
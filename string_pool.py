@@ -0,0 +1,118 @@
+from compilation_engine import text
+from code_generator import POOL_CLASS
+from cost_model import LOOP_ITERATIONS
+
+# Heap words one pooled String costs: the String object and its character buffer,
+# each with its Memory.alloc header
+STRING_OVERHEAD_WORDS = 5
+
+
+def string_words(string: str) -> int:
+    return len(string) + STRING_OVERHEAD_WORDS
+
+
+def _loop_depth(tag) -> int:
+    depth = 0
+    while tag is not None:
+        if tag.nodeType == tag.ELEMENT_NODE and tag.tagName == 'whileStatement':
+            depth += 1
+        tag = tag.parentNode
+    return depth
+
+
+class StringPool:
+    # Collects the string constants of a whole program so each one is built once at
+    # startup (StringPool.init, called from Main.main) and every use becomes a
+    # StringPool.get lookup instead of String.new plus one String.appendChar per char.
+    # Pooled strings are shared, so programs must not mutate or dispose string constants.
+    # When nothing ends up pooled, code generation leaves the pool out entirely.
+    def __init__(self, max_words: int = None):
+        self.max_words = max_words
+        self.uses = {}
+        self.benefits = {}
+        self.strings = []
+        self.indexes = {}
+
+
+    def collect(self, parser_roots):
+        for parser_root in parser_roots:
+            for string_tag in parser_root.getElementsByTagName('stringConstant'):
+                string = text(string_tag)
+                # instructions saved per execution, weighted by loop nesting
+                saved = (2 * len(string) + 2) * LOOP_ITERATIONS ** _loop_depth(string_tag)
+                self.uses[string] = self.uses.get(string, 0) + 1
+                self.benefits[string] = self.benefits.get(string, 0) + saved
+
+        # most benefit per heap word first, until the memory budget is spent
+        candidates = sorted(self.uses, key=lambda s: (-self.benefits[s] / string_words(s), s))
+        used_words = 1
+        for string in candidates:
+            # one more pool array slot plus the string itself
+            words = string_words(string) + 1
+            if self.max_words is not None and used_words + words > self.max_words:
+                continue
+            used_words += words
+            self.indexes[string] = len(self.strings)
+            self.strings.append(string)
+
+        return self
+
+
+    def index_of(self, string: str):
+        return self.indexes.get(string)
+
+
+    def memory_words(self) -> int:
+        # pool array (with its alloc header) plus every pooled string
+        if not self.strings:
+            return 0
+        return len(self.strings) + 1 + sum(string_words(string) for string in self.strings)
+
+
+    def generate(self) -> list:
+        # VM code of the StringPool class
+        instructions = [
+            ('function', f'{POOL_CLASS}.init', 0),
+            ('push', 'constant', len(self.strings)),
+            ('call', 'Array.new', 1),
+            ('pop', 'static', 0),
+        ]
+        for index, string in enumerate(self.strings):
+            instructions.append(('push', 'static', 0))
+            instructions.append(('push', 'constant', index))
+            instructions.append(('add',))
+            instructions.append(('push', 'constant', len(string)))
+            instructions.append(('call', 'String.new', 1))
+            for char in string:
+                instructions.append(('push', 'constant', ord(char)))
+                instructions.append(('call', 'String.appendChar', 2))
+            instructions.append(('pop', 'temp', 0))
+            instructions.append(('pop', 'pointer', 1))
+            instructions.append(('push', 'temp', 0))
+            instructions.append(('pop', 'that', 0))
+        instructions.append(('push', 'constant', 0))
+        instructions.append(('return',))
+
+        instructions.extend([
+            ('function', f'{POOL_CLASS}.get', 0),
+            ('push', 'static', 0),
+            ('push', 'argument', 0),
+            ('add',),
+            ('pop', 'pointer', 1),
+            ('push', 'that', 0),
+            ('return',),
+        ])
+        return instructions
+
+
+    def report(self) -> str:
+        inline = [string for string in self.uses if string not in self.indexes]
+        budget = f'{self.max_words:,} words' if self.max_words is not None else 'unlimited'
+        lines = [
+            f'String pool: {len(self.strings)} of {len(self.uses)} distinct strings pooled '
+            f'({sum(self.uses[s] for s in self.strings)} uses, {sum(len(s) for s in self.strings)} chars)',
+            f'Heap cost: {self.memory_words():,} words (budget: {budget})',
+        ]
+        if inline:
+            lines.append(f'Left inline over budget: {len(inline)} strings')
+        return '\n'.join(lines)
@@ -0,0 +1,59 @@
+KINDS = ['static', 'field', 'arg', 'var']
+
+# VM memory segment each kind of variable lives in
+SEGMENTS = {
+    'static': 'static',
+    'field': 'this',
+    'arg': 'argument',
+    'var': 'local',
+}
+
+# minidom user data keys the compilation engine records resolved symbols under. None of
+# them show up in the xml output
+SYMBOL_KEY = 'symbol'  # (type, kind, slot) on varName identifiers, declared or used
+SCOPE_KEY = 'scope'    # the class SymbolTable on class tags, var counts on subroutineDec tags
+CALL_KEY = 'call'      # (full name, subroutine kind or None) on called subroutineName identifiers
+
+class SymbolTable:
+    # Symbols of one class. Each variable gets a slot per kind, numbered in declaration
+    # order. Subroutine symbols shadow class symbols in a single dict and are undone by
+    # start_subroutine, so resolving a name is one lookup whatever scope it is in
+    def __init__(self, class_name: str = None):
+        self.class_name = class_name
+        self.symbols = {}
+        # (name, shadowed symbol or None) for every subroutine-level definition
+        self.shadowed = []
+        self.counts = {kind: 0 for kind in KINDS}
+        # subroutine name -> 'constructor', 'function' or 'method'
+        self.subroutines = {}
+
+
+    def start_subroutine(self):
+        for name, symbol in reversed(self.shadowed):
+            if symbol is None:
+                del self.symbols[name]
+            else:
+                self.symbols[name] = symbol
+        self.shadowed = []
+        self.counts['arg'] = 0
+        self.counts['var'] = 0
+
+
+    def define(self, name: str, var_type: str, kind: str) -> tuple:
+        if kind not in KINDS:
+            raise ValueError(f'Unknown variable kind: {kind}')
+
+        if kind in ['arg', 'var']:
+            self.shadowed.append((name, self.symbols.get(name)))
+        symbol = self.symbols[name] = (var_type, kind, self.counts[kind])
+        self.counts[kind] += 1
+        return symbol
+
+
+    def var_count(self, kind: str) -> int:
+        return self.counts[kind]
+
+
+    def lookup(self, name: str):
+        # (type, kind, slot), or None for class names and undefined variables
+        return self.symbols.get(name)
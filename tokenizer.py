@@ -15,23 +15,48 @@ SYMBOLS = [
     '>', '=', '~'
 ]
 
+# 'python' lexes char by char, 'numpy' classifies whole arrays of chars at once (see
+# bulk_lexer.py) and 'auto' picks numpy for sources of at least BULK_MIN_CHARS
+LEXERS = ['python', 'numpy', 'auto']
+BULK_MIN_CHARS = 256 * 1024
+
 class Tokenizer:
-    def __init__(self, jack_file: str):
-        with open(jack_file) as f:
-            jack = f.read()
+    def __init__(self, jack_file: str = None, source=None, lexer: str = 'python'):
+        if source is not None:
+            # in-memory Jack source, as text or utf-8 bytes
+            jack = source.decode('utf-8') if isinstance(source, (bytes, bytearray)) else source
+        elif jack_file is not None:
+            with open(jack_file) as f:
+                jack = f.read()
+        else:
+            raise ValueError('Tokenizer needs either a jack_file or Jack source')
+        if lexer not in LEXERS:
+            raise ValueError(f'Unknown lexer {lexer!r}, expected one of {LEXERS}')
+
+        tokens = None
+        if lexer == 'numpy' or (lexer == 'auto' and len(jack) >= BULK_MIN_CHARS):
+            from bulk_lexer import bulk_tokens
+            # None without NumPy, or for input only the char by char lexer handles
+            tokens = bulk_tokens(jack)
+
+        if tokens is None:
+            # Pre-process jack code
+            jack = self._remove_comment_lines(jack)
+            jack = self._remove_inline_comments(jack)
+            jack = self._remove_multi_line_comments(jack)
+            jack = self._remove_whitespace(jack)
+            tokens = self._get_tokens(jack)
 
+        self._init_tokens(tokens)
+
+
+    def _init_tokens(self, tokens: list):
         # Initialize xml
         self.tokenizer_root = minidom.Document()
         self.tokenizer_xml = self.tokenizer_root.createElement('tokens')
         self.tokenizer_root.appendChild(self.tokenizer_xml)
 
-        # Pre-process jack code
-        jack = self._remove_comment_lines(jack)
-        jack = self._remove_inline_comments(jack)
-        jack = self._remove_multi_line_comments(jack)
-        jack = self._remove_whitespace(jack)
-
-        self.tokens = self._get_tokens(jack)
+        self.tokens = tokens
 
         # Initialize token indexer, call self.advance() for first token
         self.current_token_index = -1
@@ -185,9 +210,23 @@ class Tokenizer:
         self.tokenizer_xml.appendChild(tokenizer_tag)
 
 
-    def write_xml_file(self, output_file: str):
+    def write_token_tags(self):
+        # *T.xml tags for all tokens, wherever the tokenizer is at
+        self.current_token_index = -1
+        while self.has_more_tokens():
+            token, token_type = self.advance()
+            self.write_token_tag(token_type, token)
+        # Reinitialize current_token_index
+        self.current_token_index = -1
+
+
+    def to_xml(self) -> str:
         xml_str = self.tokenizer_root.toprettyxml()
         # remove xml header
-        xml_str = '\n'.join([l for l in xml_str.splitlines()[1:]])
+        return '\n'.join([l for l in xml_str.splitlines()[1:]])
+
+
+    def write_xml_file(self, output_file: str):
+        xml_str = self.to_xml()
         with open(output_file, 'w') as f:
             f.write(xml_str)
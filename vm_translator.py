@@ -0,0 +1,182 @@
+SEGMENT_POINTERS = {
+    'local': 'LCL',
+    'argument': 'ARG',
+    'this': 'THIS',
+    'that': 'THAT',
+}
+TEMP_BASE = 5
+POINTER_BASE = 3
+STACK_BASE = 256
+
+BINARY_ARITHMETIC = {
+    'add': 'M=D+M',
+    'sub': 'M=M-D',
+    'and': 'M=D&M',
+    'or': 'M=D|M',
+}
+UNARY_ARITHMETIC = {
+    'neg': 'M=-M',
+    'not': 'M=!M',
+}
+COMPARISONS = {
+    'eq': 'JEQ',
+    'gt': 'JGT',
+    'lt': 'JLT',
+}
+
+# pop the top of the stack into D
+POP_D = ['@SP', 'AM=M-1', 'D=M']
+# push D onto the stack
+PUSH_D = ['@SP', 'A=M', 'M=D', '@SP', 'M=M+1']
+
+
+def parse_vm(vm: str) -> list:
+    # VM text (for example the OS .vm files) into the command tuples CodeGenerator produces
+    instructions = []
+    for line in vm.splitlines():
+        parts = line.split('//')[0].split()
+        if not parts:
+            continue
+        if parts[0] in ['push', 'pop', 'function', 'call']:
+            parts[2] = int(parts[2])
+        instructions.append(tuple(parts))
+    return instructions
+
+
+class VMTranslator:
+    # Translates VM command tuples into Hack assembly, one instruction string per line
+    def __init__(self):
+        self.asm = []
+        self.label_count = 0
+        self.function_name = None
+        self.class_name = None
+
+
+    def bootstrap(self):
+        self.asm.extend([f'@{STACK_BASE}', 'D=A', '@SP', 'M=D'])
+        self.write_call('Sys.init', 0)
+
+
+    def translate(self, class_name: str, instructions: list):
+        # class_name scopes the static segment, like one .vm file
+        self.class_name = class_name
+        for instruction in instructions:
+            command = instruction[0]
+            if command == 'push':
+                self.write_push(instruction[1], instruction[2])
+            elif command == 'pop':
+                self.write_pop(instruction[1], instruction[2])
+            elif command in BINARY_ARITHMETIC:
+                self.asm.extend(POP_D + ['A=A-1', BINARY_ARITHMETIC[command]])
+            elif command in UNARY_ARITHMETIC:
+                self.asm.extend(['@SP', 'A=M-1', UNARY_ARITHMETIC[command]])
+            elif command in COMPARISONS:
+                self.write_comparison(command)
+            elif command == 'label':
+                self.asm.append(f'({self.function_name}${instruction[1]})')
+            elif command == 'goto':
+                self.asm.extend([f'@{self.function_name}${instruction[1]}', '0;JMP'])
+            elif command == 'if-goto':
+                self.asm.extend(POP_D + [f'@{self.function_name}${instruction[1]}', 'D;JNE'])
+            elif command == 'function':
+                self.write_function(instruction[1], instruction[2])
+            elif command == 'call':
+                self.write_call(instruction[1], instruction[2])
+            elif command == 'return':
+                self.write_return()
+            else:
+                raise ValueError(f'Unknown VM command: {" ".join(map(str, instruction))}')
+
+        return self.asm
+
+
+    def _unique_label(self, prefix: str) -> str:
+        self.label_count += 1
+        return f'{prefix}.{self.label_count}'
+
+
+    def write_comparison(self, command: str):
+        true_label = self._unique_label('CMP_TRUE')
+        end_label = self._unique_label('CMP_END')
+        self.asm.extend(POP_D + [
+            'A=A-1', 'D=M-D', f'@{true_label}', f'D;{COMPARISONS[command]}',
+            '@SP', 'A=M-1', 'M=0', f'@{end_label}', '0;JMP',
+            f'({true_label})', '@SP', 'A=M-1', 'M=-1',
+            f'({end_label})',
+        ])
+
+
+    def _address(self, segment: str, index: int) -> list:
+        # instructions leaving the segment address in A
+        if segment in SEGMENT_POINTERS:
+            if index == 0:
+                return [f'@{SEGMENT_POINTERS[segment]}', 'A=M']
+            return [f'@{index}', 'D=A', f'@{SEGMENT_POINTERS[segment]}', 'A=D+M']
+        elif segment == 'temp':
+            return [f'@R{TEMP_BASE + index}']
+        elif segment == 'pointer':
+            return [f'@R{POINTER_BASE + index}']
+        elif segment == 'static':
+            return [f'@{self.class_name}.{index}']
+        raise ValueError(f'Unknown segment: {segment}')
+
+
+    def write_push(self, segment: str, index: int):
+        if segment == 'constant':
+            if index in [0, 1]:
+                self.asm.extend(['@SP', 'M=M+1', 'A=M-1', f'M={index}'])
+                return
+            self.asm.extend([f'@{index}', 'D=A'] + PUSH_D)
+        else:
+            self.asm.extend(self._address(segment, index) + ['D=M'] + PUSH_D)
+
+
+    def write_pop(self, segment: str, index: int):
+        if segment in SEGMENT_POINTERS and index != 0:
+            # address to R13 first, the pop needs D for the value
+            self.asm.extend([
+                f'@{index}', 'D=A', f'@{SEGMENT_POINTERS[segment]}', 'D=D+M', '@R13', 'M=D',
+            ] + POP_D + ['@R13', 'A=M', 'M=D'])
+        else:
+            self.asm.extend(POP_D + self._address(segment, index) + ['M=D'])
+
+
+    def write_function(self, function_name: str, n_locals: int):
+        self.function_name = function_name
+        self.asm.append(f'({function_name})')
+        if n_locals:
+            self.asm.extend(['@SP', 'A=M'])
+            for _ in range(n_locals):
+                self.asm.extend(['M=0', 'A=A+1'])
+            self.asm.extend(['D=A', '@SP', 'M=D'])
+
+
+    def write_call(self, function_name: str, n_args: int):
+        return_label = self._unique_label(f'{self.function_name or "Bootstrap"}$ret')
+        self.asm.append(f'@{return_label}')
+        self.asm.extend(['D=A'] + PUSH_D)
+        for pointer in ['LCL', 'ARG', 'THIS', 'THAT']:
+            self.asm.extend([f'@{pointer}', 'D=M'] + PUSH_D)
+        self.asm.extend([
+            # ARG = SP - 5 - n_args
+            '@SP', 'D=M', f'@{5 + n_args}', 'D=D-A', '@ARG', 'M=D',
+            # LCL = SP
+            '@SP', 'D=M', '@LCL', 'M=D',
+            f'@{function_name}', '0;JMP',
+            f'({return_label})',
+        ])
+
+
+    def write_return(self):
+        self.asm.extend([
+            # R13 = frame, R14 = return address
+            '@LCL', 'D=M', '@R13', 'M=D',
+            '@5', 'A=D-A', 'D=M', '@R14', 'M=D',
+            # *ARG = return value, SP = ARG + 1
+        ] + POP_D + [
+            '@ARG', 'A=M', 'M=D',
+            '@ARG', 'D=M+1', '@SP', 'M=D',
+        ])
+        for pointer in ['THAT', 'THIS', 'ARG', 'LCL']:
+            self.asm.extend(['@R13', 'AM=M-1', 'D=M', f'@{pointer}', 'M=D'])
+        self.asm.extend(['@R14', 'A=M', '0;JMP'])
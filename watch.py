@@ -0,0 +1,135 @@
+import os
+import time
+
+from compiler import compile_many, WorkerPool
+from compilation_engine import CompilationEngine
+from sources import scan_entries
+
+# Seconds between polls, and of quiet after the last change before re-analyzing. A save
+# shows up within POLL_INTERVAL and is analyzed DEBOUNCE later, well inside 100 ms
+POLL_INTERVAL = 0.02
+DEBOUNCE = 0.04
+
+
+class Watcher:
+    # Polls the modification times of an Analyzer's jack files and re-analyzes (and
+    # re-compares) only the files that changed. Sources, the compilation engine (with its
+    # class tables) and, with workers, one worker pool are kept between runs; each compile
+    # result is freed once its output is written
+    def __init__(self, analyzer, comparer=None, interval=POLL_INTERVAL, debounce=DEBOUNCE):
+        analyzer._require_files('Watching')
+        self.analyzer = analyzer
+        self.comparer = comparer
+        self.interval = interval
+        self.debounce = debounce
+        self.compilation_engine = CompilationEngine(None)
+        workers = analyzer.workers
+        self.pool = WorkerPool(workers) if workers is not None and workers > 1 else None
+        self.stamps = {}
+        self.sources = {}
+
+
+    def snapshot(self) -> dict:
+        # (mtime, size) of every watched jack file, by path
+        target_path = self.analyzer.target_path
+        if not os.path.isdir(target_path):
+            try:
+                stat = os.stat(target_path)
+            except FileNotFoundError:
+                return {}
+            return {target_path: (stat.st_mtime_ns, stat.st_size)}
+
+        snapshot = {}
+        for entry in scan_entries(target_path, self.analyzer.recursive):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # removed between listing the directory and stat
+                continue
+            snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+
+    def _settle(self, snapshot: dict) -> dict:
+        # debounce: keep polling until nothing has changed for self.debounce seconds, so
+        # a burst of saves is analyzed once
+        quiet_since = time.perf_counter()
+        while time.perf_counter() - quiet_since < self.debounce:
+            time.sleep(self.interval)
+            latest = self.snapshot()
+            if latest != snapshot:
+                snapshot, quiet_since = latest, time.perf_counter()
+        return snapshot
+
+
+    def update(self, paths: list) -> list:
+        # Analyze and compare the given files, skipping those whose contents are unchanged.
+        # A file that fails to compile (likely a save mid-edit) is reported and skipped
+        output_files = []
+        for path in paths:
+            try:
+                with open(path) as f:
+                    source = f.read()
+            except FileNotFoundError:
+                continue
+            if self.sources.get(path) == source:
+                continue
+            self.sources[path] = source
+
+            try:
+                result = next(compile_many(
+                    [(path, source)], self.analyzer.workers, self.analyzer.lexer, self.compilation_engine,
+                    pool=self.pool
+                ))
+            except Exception as e:
+                print(f'Failed to analyze {path}: {e!r}')
+                continue
+            output_files.append(self.analyzer.write_result(result))
+
+        if self.comparer is not None:
+            for output_file in output_files:
+                compare_file = self.comparer.matching_file(output_file)
+                if compare_file is not None:
+                    self.comparer.compare_file(output_file, compare_file)
+
+        return output_files
+
+
+    def remove(self, paths: list):
+        for path in paths:
+            self.sources.pop(path, None)
+            print(f'Removed {path}')
+
+
+    def watch(self):
+        self.stamps = self.snapshot()
+        self.update(sorted(self.stamps))
+        print(f'Watching {len(self.stamps)} jack files for changes (Ctrl-C to stop)...')
+
+        try:
+            while True:
+                time.sleep(self.interval)
+                snapshot = self.snapshot()
+                if snapshot == self.stamps:
+                    continue
+
+                snapshot = self._settle(snapshot)
+                changed = sorted(path for path, stamp in snapshot.items() if self.stamps.get(path) != stamp)
+                removed = sorted(path for path in self.stamps if path not in snapshot)
+                self.stamps = snapshot
+
+                start = time.perf_counter()
+                self.remove(removed)
+                output_files = self.update(changed)
+                if changed:
+                    # from the newest save (by mtime) to the results being printed
+                    latency = time.time() - max(snapshot[path][0] for path in changed) / 1e9
+                    print(
+                        f'Re-analyzed {len(output_files)} of {len(changed)} changed files in '
+                        f'{(time.perf_counter() - start) * 1000:.1f} ms, {latency * 1000:.0f} ms after the last save'
+                    )
+        except KeyboardInterrupt:
+            print('Stopped watching.')
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()